@@ -0,0 +1,58 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from Contraction_Hierarchy import hierarchy_path, load_contraction_hierarchy, open_contraction_hierarchy
+from Diversity_Metric_Test import DiversityMetrics
+from Graph_Cache import compiled_path, load_compiled_graph, open_compiled_graph
+from Headless_Query import summary_row
+from Modified_BDA import k_shortest_paths
+
+# Graphs and hierarchies shared by the queries of one worker process, by graph name (mapped from the compiled files)
+_worker = {}
+
+def init_worker(graph_files):
+    """Map every graph name -> (compiled file, hierarchy file or None) in this process (the query pools' initializer)."""
+    for name, (compiled_filename, hierarchy_filename) in graph_files.items():
+        graph = open_compiled_graph(compiled_filename)
+        _worker[name] = (graph, open_contraction_hierarchy(hierarchy_filename) if hierarchy_filename else None)
+
+def run_worker_query(name, start, end, k, mode='dijkstra', route_cost=None, engine='mbda'):
+    """Search a graph mapped by init_worker; returns (graph, sorted paths, DiversityMetrics of the paths)."""
+    graph, hierarchy = _worker[name]
+    paths, _ = k_shortest_paths(graph, start, end, k, graph.pos, mode=mode, hierarchy=hierarchy,
+                                cost_model=route_cost, engine=engine)
+    return graph, paths, DiversityMetrics(paths, graph)
+
+def _run_query(query, name, mode, route_cost, engine):
+    start, end, k = query
+    _, paths, metrics = run_worker_query(name, start, end, k, mode, route_cost, engine)
+    return summary_row(start, end, k, paths, metrics)
+
+def batch_k_shortest_paths(nodes_filename, edges_filename, queries, processes=None, mode='dijkstra', cost_model=None,
+                           use_hierarchy=True, engine='mbda', chunksize=16):
+    """Run k_shortest_paths and the diversity metrics for many (start, end, k) queries.
+
+    The graph is compiled once and every worker process memory-maps the same compiled
+    file, so the operating system shares its pages between processes. Returns one row per
+    query, in query order, with the fields of Headless_Query.CSV_COLUMNS (see write_csv there).
+    """
+    graph = load_compiled_graph(nodes_filename, edges_filename)  # Compiles the graph if the sources changed
+    cost_model = cost_model or graph.cost_model
+    hierarchy_filename = None
+    if use_hierarchy and load_contraction_hierarchy(graph, edges_filename, build=False, cost_model=cost_model) is not None:
+        hierarchy_filename = hierarchy_path(edges_filename)  # Checked current here, so workers just map it
+    name = os.path.splitext(os.path.basename(edges_filename))[0]
+    graph_files = {name: (compiled_path(edges_filename), hierarchy_filename)}
+    run_query = partial(_run_query, name=name, mode=mode, route_cost=cost_model, engine=engine)
+
+    queries = list(queries)
+    if processes == 1 or len(queries) <= 1:
+        init_worker(graph_files)
+        return [run_query(query) for query in queries]
+    with ProcessPoolExecutor(max_workers=processes or os.cpu_count(), initializer=init_worker,
+                             initargs=(graph_files,)) as executor:
+        return list(executor.map(run_query, queries, chunksize=chunksize))
+
+def all_pairs_queries(graph, k):
+    """Every ordered pair of distinct nodes of the graph, as (start, end, k) queries."""
+    return [(start, end, k) for start in graph.nodes for end in graph.nodes if start != end]
@@ -0,0 +1,89 @@
+"""Compare the path-copying bidirectional search with the parent-pointer search on long routes."""
+import heapq
+import os
+import random
+import sys
+import time
+import tracemalloc
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Graph import Graph
+from Modified_BDA import k_shortest_paths
+
+def corridor_graph(length, width=3, seed=0):
+    """Build a long width x length grid so that end-to-end routes have about `length` nodes."""
+    rng = random.Random(seed)
+    graph_dict = defaultdict(dict)
+    travel_times = defaultdict(dict)
+    pos = {}
+    for x in range(length):
+        for y in range(width):
+            node = f"n{x}_{y}"
+            pos[node] = (float(x), float(y))
+            for neighbor in ((f"n{x + 1}_{y}", x + 1 < length), (f"n{x}_{y + 1}", y + 1 < width)):
+                if neighbor[1]:
+                    weight = rng.randint(50, 150)
+                    graph_dict[node][neighbor[0]] = graph_dict[neighbor[0]][node] = weight
+                    travel_times[node][neighbor[0]] = travel_times[neighbor[0]][node] = weight * 0.7
+    return Graph(graph_dict, travel_times, pos)
+
+def path_copying_search(graph, start, end):
+    """The previous search: every heap entry carries a copy of its whole path prefix."""
+    edges = graph.edges
+    travel_times = graph.travel_times
+    visit_counts = defaultdict(lambda: defaultdict(int))
+    forward_heap = [(0, start, [])]
+    backward_heap = [(0, end, [])]
+    forward_visited = {}
+    backward_visited = {}
+
+    while forward_heap and backward_heap:
+        dist, node, path = heapq.heappop(forward_heap)
+        if node in backward_visited:
+            return tuple(path + backward_visited[node][1][::-1]), dist + backward_visited[node][0]
+        if node not in forward_visited:
+            forward_visited[node] = (dist, path + [node])
+            for neighbor, weight in edges[node].items():
+                current_visit_count = visit_counts[node][neighbor]
+                if all(current_visit_count <= visit_counts[node][other] for other in edges[node]):
+                    heapq.heappush(forward_heap, (dist + weight + travel_times[node][neighbor], neighbor, path + [node]))
+
+        dist, node, path = heapq.heappop(backward_heap)
+        if node in forward_visited:
+            return tuple(forward_visited[node][1] + path[::-1]), forward_visited[node][0] + dist
+        if node not in backward_visited:
+            backward_visited[node] = (dist, path + [node])
+            for neighbor, weight in edges[node].items():
+                current_visit_count = visit_counts[node][neighbor]
+                if all(current_visit_count <= visit_counts[node][other] for other in edges[node]):
+                    heapq.heappush(backward_heap, (dist + weight + travel_times[node][neighbor], neighbor, path + [node]))
+    return None, None
+
+def measure(function, repeats=3):
+    """Return (best time in ms, peak traced heap in KiB, result) of function()."""
+    best = float('inf')
+    for _ in range(repeats):
+        started = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - started)
+    tracemalloc.start()
+    function()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best * 1000, peak / 1024, result
+
+def main(lengths=(250, 1000, 4000)):
+    print(f"{'route nodes':>11} {'before ms':>10} {'after ms':>9} {'before KiB':>11} {'after KiB':>10}")
+    for length in lengths:
+        graph = corridor_graph(length)
+        start, end = "n0_0", f"n{length - 1}_2"
+        graph.edges, graph.travel_times  # Build the name-keyed views outside the measurement
+        before_ms, before_kib, (path, cost) = measure(lambda: path_copying_search(graph, start, end))
+        after_ms, after_kib, (paths, paths_with_costs) = measure(lambda: k_shortest_paths(graph, start, end, 1, graph.pos))
+        assert paths_with_costs[0][1] <= cost + 1e-6  # The new search stops at the optimum
+        print(f"{len(path):>11} {before_ms:>10.1f} {after_ms:>9.1f} {before_kib:>11.0f} {after_kib:>10.0f}")
+
+
+if __name__ == "__main__":
+    main(tuple(int(arg) for arg in sys.argv[1:]) or (250, 1000, 4000))
@@ -0,0 +1,275 @@
+"""Scaling benchmark of the path search, the diversity metrics and the path rendering on synthetic graphs.
+
+    python Benchmarks/Scaling_Benchmark.py                                # grid, geometric, pedestrian at 1k and 10k edges
+    python Benchmarks/Scaling_Benchmark.py --sizes 1000 100000 1000000 --save-baseline large
+    python Benchmarks/Scaling_Benchmark.py --compare default             # exit status 1 on a regression
+
+Graphs are generated from fixed seeds in the Graphs/*.txt format (into Benchmarks/graphs/,
+reused on later runs) and loaded through the compiled graph cache like the real ones.
+For every graph and stage the best time of --repeats runs, the peak traced memory of one
+more run and, for the searches, the settled nodes are reported. The searches sweep k and
+three route lengths (start and end a quarter, half and all of the start's eccentricity
+apart, in hops). Baselines are JSON files in Benchmarks/baselines/; a comparison flags
+slower or larger stages beyond --tolerance and any change in the settled nodes. Times
+only compare on the machine that saved the baseline; the settled nodes (and, nearly,
+the peak memory) are the same everywhere.
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import sys
+from collections import deque
+
+BENCHMARKS_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARKS_DIRECTORY))
+from Diversity_Metric_Test import test_diversity_metrics
+from Graph_Cache import compile_graph, compiled_path, open_compiled_graph
+from Modified_BDA import k_shortest_paths
+from Output import draw_graph_with_path
+from Path_Memory_Benchmark import measure
+
+GRAPH_DIRECTORY = os.path.join(BENCHMARKS_DIRECTORY, "graphs")
+BASELINE_DIRECTORY = os.path.join(BENCHMARKS_DIRECTORY, "baselines")
+KINDS = ('grid', 'geometric', 'pedestrian')
+ROUTE_LENGTHS = (('short', 0.25), ('medium', 0.5), ('long', 1.0))  # Fraction of the start's eccentricity in hops
+MIN_COMPARED_MS = 5.0  # Shorter stages are mostly timer and scheduler noise
+
+def grid_edges(target_edges, rng):
+    """Square grid with 80 m blocks; about target_edges edges."""
+    side = max(2, round(math.sqrt(target_edges / 2)))
+    pos = [(x * 80.0, y * 80.0) for y in range(side) for x in range(side)]
+    edges = []
+    for y in range(side):
+        for x in range(side):
+            node = y * side + x
+            if x + 1 < side:
+                edges.append((node, node + 1, rng.randint(70, 90)))
+            if y + 1 < side:
+                edges.append((node, node + side, rng.randint(70, 90)))
+    return pos, edges
+
+def geometric_edges(target_edges, rng):
+    """Random geometric graph: points in a square joined within a radius giving about six neighbours each."""
+    count = max(4, target_edges // 3)
+    size = 80.0 * math.sqrt(count)  # The same density as the grid
+    radius = size * math.sqrt(6 / (math.pi * count))
+    pos = [(rng.uniform(0, size), rng.uniform(0, size)) for _ in range(count)]
+    cells = {}
+    for node, (x, y) in enumerate(pos):
+        cells.setdefault((int(x // radius), int(y // radius)), []).append(node)
+    edges = []
+    for node, (x, y) in enumerate(pos):
+        cx, cy = int(x // radius), int(y // radius)
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                for other in cells.get((cx + dx, cy + dy), ()):
+                    distance = math.dist(pos[node], pos[other])
+                    if node < other and distance <= radius:
+                        edges.append((node, other, max(1, round(distance))))
+    return pos, edges
+
+def pedestrian_edges(target_edges, rng):
+    """Real-like walking network: a jittered block grid with missing links, crossings and diagonal shortcuts."""
+    side = max(2, round(math.sqrt(target_edges / 1.8)))
+    pos = [(x * 80.0 + rng.uniform(-15, 15), y * 80.0 + rng.uniform(-15, 15)) for y in range(side) for x in range(side)]
+    candidates = []
+    for y in range(side):
+        for x in range(side):
+            node = y * side + x
+            if x + 1 < side:
+                candidates.append((node, node + 1))
+            if y + 1 < side:
+                candidates.append((node, node + side))
+            if x + 1 < side and y + 1 < side and rng.random() < 0.1:
+                candidates.append((node, node + side + 1))  # Path across a plaza or park
+    rng.shuffle(candidates)
+
+    # Keep a spanning forest so the network stays connected, then drop a fifth of the other links
+    parent = list(range(len(pos)))
+    def root(node):
+        while parent[node] != node:
+            parent[node] = parent[parent[node]]
+            node = parent[node]
+        return node
+    edges = []
+    for a, b in candidates:
+        joins = root(a) != root(b)
+        if joins:
+            parent[root(a)] = root(b)
+        if joins or rng.random() < 0.8:
+            edges.append((a, b, max(1, round(math.dist(pos[a], pos[b])))))
+    return pos, edges
+
+GENERATORS = {'grid': grid_edges, 'geometric': geometric_edges, 'pedestrian': pedestrian_edges}
+
+def largest_component(count, edges):
+    adjacency = [[] for _ in range(count)]
+    for a, b, _ in edges:
+        adjacency[a].append(b)
+        adjacency[b].append(a)
+    best = set()
+    seen = bytearray(count)
+    for first in range(count):
+        if seen[first]:
+            continue
+        component = {first}
+        seen[first] = 1
+        queue = deque([first])
+        while queue:
+            for other in adjacency[queue.popleft()]:
+                if not seen[other]:
+                    seen[other] = 1
+                    component.add(other)
+                    queue.append(other)
+        if len(component) > len(best):
+            best = component
+    return best
+
+def generate_graph(kind, target_edges, seed=0, directory=GRAPH_DIRECTORY):
+    """Write (or reuse) <kind>-coordinates<edges>.txt and <kind>-graph<edges>.txt; returns both file names."""
+    nodes_filename = os.path.join(directory, f"{kind}-coordinates{target_edges}.txt")
+    edges_filename = os.path.join(directory, f"{kind}-graph{target_edges}.txt")
+    if os.path.exists(nodes_filename) and os.path.exists(edges_filename):
+        return nodes_filename, edges_filename
+    os.makedirs(directory, exist_ok=True)
+    rng = random.Random(f"{kind}-{target_edges}-{seed}")
+    pos, edges = GENERATORS[kind](target_edges, rng)
+    keep = largest_component(len(pos), edges)
+
+    # Walking speed varies by link (crowds, stairs), so travel time is not a fixed multiple of distance
+    with open(nodes_filename, 'w') as file:
+        file.write(f"# Synthetic {kind} network coordinates\n# delimiter ','\n")
+        for node in sorted(keep):
+            file.write(f"n{node}, {pos[node][0]:.3f}, {pos[node][1]:.3f}\n")
+    with open(edges_filename, 'w') as file:
+        file.write(f"# Synthetic {kind} network distance (in m) and travel time (in seconds)\n# delimiter ','\n")
+        for a, b, distance in edges:
+            if a in keep:
+                file.write(f"n{a}, n{b}, {distance}, {distance / rng.uniform(1.0, 1.5):.1f}\n")
+    return nodes_filename, edges_filename
+
+def route_pairs(graph, seed=0):
+    """(length label, hops, start, end) for the ROUTE_LENGTHS, from one seeded start node."""
+    start = random.Random(seed).randrange(graph.num_nodes)
+    hops = [-1] * graph.num_nodes
+    hops[start] = 0
+    queue = deque([start])
+    order = []
+    while queue:
+        node = queue.popleft()
+        order.append(node)
+        for edge in range(graph.offsets[node], graph.offsets[node + 1]):
+            if hops[graph.targets[edge]] < 0:
+                hops[graph.targets[edge]] = hops[node] + 1
+                queue.append(graph.targets[edge])
+    eccentricity = hops[order[-1]]
+    pairs = []
+    for label, fraction in ROUTE_LENGTHS:
+        wanted = max(1, round(eccentricity * fraction))
+        end = next(node for node in order if hops[node] >= wanted)
+        pairs.append((label, hops[end], graph.node_names[start], graph.node_names[end]))
+    return pairs
+
+def benchmark_graph(kind, target_edges, ks, repeats, mode, render_limit):
+    """Yield one result row per stage of one synthetic graph."""
+    nodes_filename, edges_filename = generate_graph(kind, target_edges)
+    name = f"{kind}-{target_edges}"
+    compiled_filename = compiled_path(edges_filename)
+
+    # Load: parse the text files and write the compiled graph, then map it
+    ms, kib, _ = measure(lambda: compile_graph(nodes_filename, edges_filename, compiled_filename), 1)
+    yield {'graph': name, 'stage': 'compile', 'time_ms': ms, 'peak_kib': kib}
+    ms, kib, graph = measure(lambda: open_compiled_graph(compiled_filename), repeats)
+    yield {'graph': name, 'stage': 'open', 'time_ms': ms, 'peak_kib': kib, 'nodes': graph.num_nodes,
+           'edges': graph.num_edges // 2}
+
+    base_drawn = False
+    for length, hops, start, end in route_pairs(graph):
+        for k in ks:
+            stats = {}
+            ms, kib, (paths, _) = measure(lambda: k_shortest_paths(graph, start, end, k, graph.pos, stats=stats, mode=mode),
+                                          repeats)
+            row = {'graph': name, 'stage': 'search', 'k': k, 'length': length, 'hops': hops}
+            yield dict(row, time_ms=ms, peak_kib=kib, settled_nodes=stats['settled_nodes'], paths=len(paths))
+
+            ms, kib, _ = measure(lambda: test_diversity_metrics(paths, graph), repeats)
+            yield dict(row, stage='metrics', time_ms=ms, peak_kib=kib)
+
+            # The network layer is drawn once per graph (render-base), later paths only draw their overlay
+            if graph.num_edges // 2 <= render_limit and paths:
+                def render():
+                    figure = draw_graph_with_path(graph, paths[-1], len(paths), graph.pos, start, end, paths[-1].cost)
+                    figure.canvas.draw()
+                if not base_drawn:
+                    ms, kib, _ = measure(render, 1)  # The traced run is warm already; only the time is cold
+                    yield {'graph': name, 'stage': 'render-base', 'time_ms': ms}
+                    base_drawn = True
+                ms, kib, _ = measure(render, repeats)
+                yield dict(row, stage='render', time_ms=ms, peak_kib=kib)
+
+def row_key(row):
+    return (row['graph'], row['stage'], row.get('k'), row.get('length'))
+
+def compare(rows, baseline, tolerance):
+    """Return the regressions of rows against a baseline as printable lines."""
+    previous = {row_key(row): row for row in baseline['rows']}
+    regressions = []
+    for row in rows:
+        old = previous.get(row_key(row))
+        if old is None:
+            continue
+        label = ' '.join(str(part) for part in row_key(row) if part is not None)
+        if 'settled_nodes' in row and row['settled_nodes'] != old.get('settled_nodes'):
+            regressions.append(f"{label}: settled nodes {old.get('settled_nodes')} -> {row['settled_nodes']}")
+        for field, unit in (('time_ms', 'ms'), ('peak_kib', 'KiB')):
+            if field == 'time_ms' and old.get(field, 0) < MIN_COMPARED_MS:
+                continue
+            if field in row and old.get(field) and row[field] > old[field] * (1 + tolerance):
+                regressions.append(f"{label}: {old[field]:.1f} -> {row[field]:.1f} {unit}")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark search, metrics and rendering on synthetic graphs.")
+    parser.add_argument('--kinds', nargs='+', choices=KINDS, default=KINDS)
+    parser.add_argument('--sizes', nargs='+', type=int, default=(1000, 10000), help="target edge counts (up to 1000000)")
+    parser.add_argument('--ks', nargs='+', type=int, default=(1, 5, 10))
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--mode', default='dijkstra')
+    parser.add_argument('--render-limit', type=int, default=2000, help="largest graph (edges) to render")
+    parser.add_argument('--save-baseline', metavar='NAME')
+    parser.add_argument('--compare', metavar='NAME')
+    parser.add_argument('--tolerance', type=float, default=0.25, help="allowed slowdown or growth (0.25 = 25%%)")
+    args = parser.parse_args(argv)
+
+    rows = []
+    print(f"{'graph':<18} {'stage':<12} {'k':>3} {'length':<7} {'hops':>5} {'ms':>10} {'peak KiB':>10} {'settled':>9}")
+    for kind in args.kinds:
+        for size in args.sizes:
+            for row in benchmark_graph(kind, size, args.ks, args.repeats, args.mode, args.render_limit):
+                rows.append(row)
+                peak = f"{row['peak_kib']:.0f}" if 'peak_kib' in row else ''
+                print(f"{row['graph']:<18} {row['stage']:<12} {row.get('k', ''):>3} {row.get('length', ''):<7} "
+                      f"{row.get('hops', ''):>5} {row['time_ms']:>10.1f} {peak:>10} {row.get('settled_nodes', ''):>9}")
+
+    if args.save_baseline:
+        os.makedirs(BASELINE_DIRECTORY, exist_ok=True)
+        filename = os.path.join(BASELINE_DIRECTORY, f"{args.save_baseline}.json")
+        with open(filename, 'w') as file:
+            json.dump({'python': platform.python_version(), 'machine': platform.machine(), 'mode': args.mode,
+                       'rows': rows}, file, indent=1)
+        print(f"Saved {filename}")
+    if args.compare:
+        with open(os.path.join(BASELINE_DIRECTORY, f"{args.compare}.json")) as file:
+            regressions = compare(rows, json.load(file), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        print(f"{len(regressions)} regression(s) against {args.compare}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,253 @@
+import heapq
+import mmap
+import os
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+from Graph_Cache import graph_file_pairs, load_compiled_graph, read_sections, write_sections
+from Instrumentation import heap_functions
+
+# Persisted hierarchy layout: header, then 8-byte aligned sections
+#   costs (m doubles), rank (n ints), offsets (n + 1 ints), targets (m ints), middles (m ints)
+MAGIC = b'MBDACHIE'
+VERSION = 2
+HEADER = struct.Struct('<8sIB3xII2d32s')
+INF = float('inf')
+
+class ContractionHierarchy:
+    """Upward graph of a contraction hierarchy over a Graph's node ids.
+
+    Every node keeps only its edges to higher-ranked nodes. An edge is either an
+    original edge (middle -1) or a shortcut standing for the two edges through its
+    lower-ranked middle node.
+    """
+
+    def __init__(self, rank, offsets, targets, costs, middles, cost_model, fingerprint=None):
+        self.rank = rank  # Contraction order of each node
+        self.offsets = offsets  # Upward edges of node u are the slots offsets[u]..offsets[u + 1] - 1
+        self.targets = targets  # Higher-ranked endpoint of each upward edge (sorted per node)
+        self.costs = costs  # Search cost of each upward edge
+        self.middles = middles  # Contracted middle node of a shortcut, -1 for an original edge
+        self.cost_model = tuple(cost_model)  # (distance weight, time weight) the costs were built with
+        self.fingerprint = fingerprint  # Source hash of the graph the hierarchy was built for
+
+    @property
+    def num_nodes(self):
+        return len(self.rank)
+
+    def _middle(self, low, high):
+        # The edge between a node and a higher-ranked neighbor is stored at the lower one
+        lo, hi = self.offsets[low], self.offsets[low + 1]
+        return self.middles[bisect_left(self.targets, high, lo, hi)]
+
+    def _unpack(self, u, v, middle, path):
+        # Append the original nodes after u up to v, expanding shortcuts through their middle nodes
+        stack = [(u, v, middle)]
+        while stack:
+            a, b, m = stack.pop()
+            if m == -1:
+                path.append(b)
+                continue
+            stack.append((m, b, self._middle(m, b)))
+            stack.append((a, m, self._middle(m, a)))
+
+    def shortest_path(self, source, target, stats=None):
+        """Bidirectional upward search; returns (path of node ids, cost) or (None, None)."""
+        if source == target:
+            return (source,), 0
+        num_nodes = self.num_nodes
+        heaps = ([(0, source)], [(0, target)])
+        dists = (array('d', [INF]) * num_nodes, array('d', [INF]) * num_nodes)
+        parent_edges = (array('i', [-1]) * num_nodes, array('i', [-1]) * num_nodes)
+        parents = (array('i', [-1]) * num_nodes, array('i', [-1]) * num_nodes)
+        dists[0][source] = 0
+        dists[1][target] = 0
+        best_cost = INF
+        meeting = -1
+        settled_nodes = 0
+        push, pop = heap_functions(stats)  # Counting heap operations only when stats are kept
+
+        # Both searches only go up; a side is done once its frontier cannot beat the best meeting
+        while (heaps[0] and heaps[0][0][0] < best_cost) or (heaps[1] and heaps[1][0][0] < best_cost):
+            side = 0 if heaps[0] and (not heaps[1] or heaps[0][0][0] <= heaps[1][0][0]) else 1
+            dist, node = pop(heaps[side])
+            if dist > dists[side][node]:
+                continue
+            settled_nodes += 1
+            if dist + dists[1 - side][node] < best_cost:
+                best_cost = dist + dists[1 - side][node]
+                meeting = node
+            side_dist = dists[side]
+            for edge in range(self.offsets[node], self.offsets[node + 1]):
+                neighbor = self.targets[edge]
+                new_dist = dist + self.costs[edge]
+                if new_dist < side_dist[neighbor]:
+                    side_dist[neighbor] = new_dist
+                    parents[side][neighbor] = node
+                    parent_edges[side][neighbor] = edge
+                    push(heaps[side], (new_dist, neighbor))
+
+        if stats is not None:
+            stats['settled_nodes'] = settled_nodes
+        if meeting == -1:
+            return None, None
+
+        # Collect the upward chains start -> meeting and end -> meeting, then unpack the shortcuts
+        chains = []
+        for side in (0, 1):
+            chain = []
+            node = meeting
+            while parents[side][node] != -1:
+                chain.append((parents[side][node], node, self.middles[parent_edges[side][node]]))
+                node = parents[side][node]
+            chains.append(chain)
+        path = [source]
+        for low, high, middle in reversed(chains[0]):
+            self._unpack(low, high, middle, path)
+        for low, high, middle in chains[1]:
+            self._unpack(high, low, middle, path)
+        return tuple(path), best_cost
+
+    def save(self, filename):
+        """Write the hierarchy to disk (atomically replacing any previous file)."""
+        fingerprint = bytes.fromhex(self.fingerprint) if self.fingerprint else b''
+        header = HEADER.pack(MAGIC, VERSION, sys.byteorder == 'little', self.num_nodes, len(self.targets),
+                             *self.cost_model, fingerprint)
+        sections = [array('d', self.costs).tobytes(), array('i', self.rank).tobytes(), array('i', self.offsets).tobytes(),
+                    array('i', self.targets).tobytes(), array('i', self.middles).tobytes()]
+        return write_sections(filename, header, sections)
+
+def build_contraction_hierarchy(graph, cost_model=None, witness_limit=500):
+    """Contract every node of the graph in edge-difference order and return the hierarchy."""
+    cost_model = cost_model or graph.cost_model
+    costs = graph.edge_costs(cost_model)
+    num_nodes = graph.num_nodes
+    # Remaining graph as adjacency dicts: neighbor -> (cost, middle node or -1)
+    adjacency = [dict() for _ in range(num_nodes)]
+    for u in range(num_nodes):
+        for edge in range(graph.offsets[u], graph.offsets[u + 1]):
+            v = graph.targets[edge]
+            if v != u and costs[edge] < adjacency[u].get(v, (INF,))[0]:
+                adjacency[u][v] = adjacency[v][u] = (costs[edge], -1)
+
+    def witness_costs(start, excluded, max_cost):
+        # Bounded Dijkstra in the remaining graph that avoids the node being contracted
+        dist = {start: 0}
+        heap = [(0, start)]
+        settled = 0
+        while heap and settled < witness_limit:
+            d, u = heapq.heappop(heap)
+            if d > dist[u]:
+                continue
+            if d > max_cost:
+                break
+            settled += 1
+            for v, (cost, _) in adjacency[u].items():
+                if v != excluded and d + cost < dist.get(v, INF):
+                    dist[v] = d + cost
+                    heapq.heappush(heap, (d + cost, v))
+        return dist
+
+    def shortcuts(v):
+        # Shortcuts needed to keep all shortest paths through v once v is removed
+        neighbors = list(adjacency[v].items())
+        needed = []
+        for i, (u, (cost_u, _)) in enumerate(neighbors):
+            others = neighbors[i + 1:]
+            if not others:
+                break
+            max_cost = cost_u + max(cost for _, (cost, _) in others)
+            witness = witness_costs(u, v, max_cost)
+            for w, (cost_w, _) in others:
+                if witness.get(w, INF) > cost_u + cost_w:
+                    needed.append((u, w, cost_u + cost_w))
+        return needed
+
+    contracted_neighbors = [0] * num_nodes
+
+    def priority(v):
+        return len(shortcuts(v)) - len(adjacency[v]) + contracted_neighbors[v]
+
+    heap = [(priority(v), v) for v in range(num_nodes)]
+    heapq.heapify(heap)
+    rank = array('i', [0]) * num_nodes
+    upward = [None] * num_nodes
+    order = 0
+    while heap:
+        # Lazy updates: re-evaluate the cheapest node and contract it only if it is still the cheapest
+        _, v = heapq.heappop(heap)
+        current = priority(v)
+        if heap and current > heap[0][0]:
+            heapq.heappush(heap, (current, v))
+            continue
+        for u, w, cost in shortcuts(v):
+            if cost < adjacency[u].get(w, (INF,))[0]:
+                adjacency[u][w] = adjacency[w][u] = (cost, v)
+        rank[v] = order
+        order += 1
+        upward[v] = adjacency[v]
+        for u in adjacency[v]:
+            del adjacency[u][v]
+            contracted_neighbors[u] += 1
+        adjacency[v] = {}
+
+    offsets = array('i', [0])
+    targets = array('i')
+    up_costs = array('d')
+    middles = array('i')
+    for v in range(num_nodes):
+        for u in sorted(upward[v]):
+            cost, middle = upward[v][u]
+            targets.append(u)
+            up_costs.append(cost)
+            middles.append(middle)
+        offsets.append(len(targets))
+    return ContractionHierarchy(rank, offsets, targets, up_costs, middles, cost_model, graph.fingerprint)
+
+def hierarchy_path(edges_filename):
+    """Return the persisted hierarchy file that sits next to the edges file."""
+    return os.path.splitext(edges_filename)[0] + '.ch'
+
+def open_contraction_hierarchy(filename):
+    """Map a persisted hierarchy into memory; returns None if the file is missing or unreadable."""
+    try:
+        with open(filename, 'rb') as file:
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+    if len(mapped) < HEADER.size:
+        return None
+    magic, version, little, num_nodes, num_edges, distance_weight, time_weight, fingerprint = HEADER.unpack_from(mapped)
+    if magic != MAGIC or version != VERSION or little != (sys.byteorder == 'little'):
+        return None
+
+    costs, rank, offsets, targets, middles = read_sections(mapped, HEADER.size, [
+        (8 * num_edges, 'd'), (4 * num_nodes, 'i'), (4 * (num_nodes + 1), 'i'), (4 * num_edges, 'i'), (4 * num_edges, 'i')])
+    hierarchy = ContractionHierarchy(rank, offsets, targets, costs, middles, (distance_weight, time_weight), fingerprint.hex())
+    hierarchy._mapped = mapped  # Keep the mapping alive as long as the hierarchy
+    return hierarchy
+
+def load_contraction_hierarchy(graph, edges_filename, build=True, cost_model=None):
+    """Return the persisted hierarchy for a compiled graph, (re)building it when stale if build is set."""
+    cost_model = cost_model or graph.cost_model
+    filename = hierarchy_path(edges_filename)
+    hierarchy = open_contraction_hierarchy(filename)
+    if (hierarchy is not None and graph.fingerprint is not None and hierarchy.fingerprint == graph.fingerprint
+            and hierarchy.cost_model == cost_model):
+        return hierarchy
+    if not build:
+        return None
+    hierarchy = build_contraction_hierarchy(graph, cost_model)
+    if graph.fingerprint is not None:
+        hierarchy.save(filename)
+    return hierarchy
+
+
+if __name__ == "__main__":
+    # Preprocess every <name>-coordinates<N>.txt / <name>-graph<N>.txt pair in the given directories
+    for directory in sys.argv[1:] or ["Graphs"]:
+        for nodes_filename, edges_filename in graph_file_pairs(directory):
+            graph = load_compiled_graph(nodes_filename, edges_filename)
+            build_contraction_hierarchy(graph).save(hierarchy_path(edges_filename))
+            print(f"Built {hierarchy_path(edges_filename)}")
@@ -1,97 +1,269 @@
+import numpy as np
 from Modified_BDA import k_shortest_paths
-from Graph import Graph, read_graph_from_files
+from Graph import Graph, PathResult, read_graph_from_files
+from Instrumentation import count, timed
+
+try:
+    from scipy import sparse  # Sparse incidence matrices; dense NumPy arrays work too on these graph sizes
+except ImportError:
+    sparse = None
 
 def calculate_path_cost(path, graph):
     """Calculate the total cost of a given path."""
-    cost = 0
-    for i in range(len(path) - 1):
-        cost += graph.edges[path[i]][path[i + 1]]  # Assuming graph.edges is a dictionary of edge weights
-    return cost
+    return _path_result(path, graph).distance
+
+def _path_result(path, graph):
+    # Results from k_shortest_paths carry their totals; a plain list of names is measured once here
+    if isinstance(path, PathResult):
+        return path
+    return PathResult(graph, graph.path_ids(path), None)
 
 def cost_absolute_difference(main_path, alternative_path, graph):
     """Calculate the absolute difference metric for cost."""
-    l_main = calculate_path_cost(main_path, graph)  # Calculate cost of the main path
-    l_alt = calculate_path_cost(alternative_path, graph)  # Calculate cost of the alternative path
+    return _cost_absolute_difference(_path_result(main_path, graph), _path_result(alternative_path, graph))
+
+def _cost_absolute_difference(main, alternative):
+    l_main = main.distance  # Cost of the main path
+    l_alt = alternative.distance  # Cost of the alternative path
     if l_main == 0:
         return 0  # Avoid division by zero
     return ((l_alt - l_main) / l_main) * 100
 
 def path_overlap_analysis(path1, path2, graph):
     """Calculate the path overlap metric."""
-    shared_edges = set()
-    for i in range(len(path1) - 1):
-        edge1 = (path1[i], path1[i + 1])
-        for j in range(len(path2) - 1):
-            edge2 = (path2[j], path2[j + 1])
-            if edge1 == edge2 or edge1[::-1] == edge2:  # Check for both directions
-                shared_edges.add(edge1)
-    l_alt = calculate_path_cost(path2, graph)  # Calculate cost of the alternative path
+    return _path_overlap_analysis(_path_result(path1, graph), _path_result(path2, graph), graph)
+
+def _path_overlap_analysis(result1, result2, graph):
+    undirected = _undirected_edges(graph)
+    edges2 = {undirected[slot] for slot in result2.slots}  # Both directions map to the same id
+    shared_slots = {slot for slot in result1.slots if undirected[slot] in edges2}
+    l_alt = result2.distance  # Cost of the alternative path
     if l_alt == 0:
         return 0  # Avoid division by zero
-    return (sum(graph.edges[edge[0]][edge[1]] for edge in shared_edges) / l_alt) * 100
+    return (sum(graph.weights[slot] for slot in shared_slots) / l_alt) * 100
+
+def _undirected_edges(graph):
+    # Edge slot -> id shared by u -> v and v -> u (the smaller of the two slots), computed once per graph
+    if 'undirected_edges' not in graph.derived:
+        undirected = np.arange(graph.num_edges)
+        for u in range(graph.num_nodes):
+            for edge in range(graph.offsets[u], graph.offsets[u + 1]):
+                reverse = graph.edge_index(graph.targets[edge], u)
+                if reverse != -1 and reverse < edge:
+                    undirected[edge] = reverse
+        graph.derived['undirected_edges'] = undirected
+    return graph.derived['undirected_edges']
 
 def travel_time_absolute_difference(main_path, alternative_path, graph):
     """Calculate the absolute difference metric for travel time."""
-    t_main = sum(graph.travel_times[main_path[i]][main_path[i + 1]] for i in range(len(main_path) - 1))
-    t_alt = sum(graph.travel_times[alternative_path[i]][alternative_path[i + 1]] for i in range(len(alternative_path) - 1))
+    return _travel_time_absolute_difference(_path_result(main_path, graph), _path_result(alternative_path, graph))
+
+def _travel_time_absolute_difference(main, alternative):
+    t_main = main.travel_time
+    t_alt = alternative.travel_time
     if t_main == 0:
         return 0  # Avoid division by zero
     return ((t_alt - t_main) / t_main) * 100
 
 def detour_factor(main_path, alternative_path, graph):
     """Calculate the detour factor (alternative path length / main path length)."""
-    l_main = calculate_path_cost(main_path, graph)
-    l_alt = calculate_path_cost(alternative_path, graph)
+    return _detour_factor(_path_result(main_path, graph), _path_result(alternative_path, graph))
+
+def _detour_factor(main, alternative):
+    l_main = main.distance
+    l_alt = alternative.distance
     if l_main == 0:
         return 0  # Avoid division by zero
     return (l_alt / l_main)
 
-def test_diversity_metrics(sorted_paths, graph):
+def _incidence(records, graph):
+    # Path x undirected edge matrices: the distance of each edge as the path travels it, and the 0/1 pattern.
+    # Multiplying the distances of some paths by the pattern of others sums every distance they share.
+    k = len(records)
+    slots = np.concatenate([np.asarray(record.slots, dtype=np.intp) for record in records]) if k else np.zeros(0, np.intp)
+    rows = np.repeat(np.arange(k), [len(record.slots) for record in records])
+    columns = _undirected_edges(graph)[slots]
+    weights = np.asarray(graph.weights, dtype=np.float64)[slots]
+    if sparse is not None:
+        weighted = sparse.csr_matrix((weights, (rows, columns)), shape=(k, graph.num_edges))
+        pattern = sparse.csr_matrix((np.ones(len(slots)), (rows, columns)), shape=(k, graph.num_edges))
+    else:
+        weighted = np.zeros((k, graph.num_edges))
+        pattern = np.zeros((k, graph.num_edges))
+        weighted[rows, columns] = weights
+        pattern[rows, columns] = 1
+    return weighted, pattern
+
+def _stack(top, bottom):
+    return sparse.vstack([top, bottom], format='csr') if sparse is not None else np.vstack([top, bottom])
+
+def _shared_distance(weighted, pattern):
+    # Distance each path of weighted shares with each path of pattern
+    shared = weighted @ pattern.T
+    return shared.toarray() if sparse is not None else shared
+
+def _totals(records):
+    return (np.array([record.distance for record in records], dtype=np.float64),
+            np.array([record.travel_time for record in records], dtype=np.float64))
+
+def _metric_block(main_totals, alternative_totals, shared):
+    # Same expressions as the single-pair metrics, broadcast over [main, alternative]
+    l_main, l_alt = main_totals[0][:, None], alternative_totals[0][None, :]
+    t_main, t_alt = main_totals[1][:, None], alternative_totals[1][None, :]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cd = np.where(l_main == 0, 0, ((l_alt - l_main) / l_main) * 100)
+        po = np.where(l_alt == 0, 0, (shared / l_alt) * 100)
+        tt_ab = np.where(t_main == 0, 0, ((t_alt - t_main) / t_main) * 100)
+        df = np.where(l_main == 0, 0, l_alt / l_main)
+    return cd, po, tt_ab, df
+
+class DiversityMetrics:
+    """Diversity metrics of one set of paths, computed once and shared by every consumer.
+
+    pairwise holds a (label, cd, po, tt_ab, df) row per pair i < j, averages the
+    per-path averages over the pairs each path takes part in, and overall the averages
+    over all pairs (None with fewer than two paths). The k x k arrays cd, po, tt_ab and
+    df are indexed [main path, alternative path]. extend() adds paths later (when k
+    grows) without recomputing the pairs that are already known, and insert() places a
+    path among the others (keeping them in cost order) by reusing those pairs. With a stats dict,
+    every extend() adds its time ('metrics_ms') and pair evaluations ('metric_pairs').
+    """
+
+    def __init__(self, sorted_paths, graph, stats=None):
+        self.graph = graph
+        self.stats = stats
+        self.paths = []
+        self.pairwise = []
+        self.averages = []
+        self.overall = None
+        self.cd = self.po = self.tt_ab = self.df = np.zeros((0, 0))
+        self._matrices = np.zeros((4, 0, 0))  # Buffer the four matrices are views of (see _grow)
+        self._pair_rows = {}  # (i, j) -> pairwise row
+        self._path_metrics = {}  # Running sums per path
+        self._total = {'cd': 0, 'po': 0, 'tt_ab': 0, 'df': 0, 'count': 0}
+        self._weighted, self._pattern = _incidence([], graph)
+        self._distance, self._travel_time = _totals([])
+        self.extend(sorted_paths)
+
+    def extend(self, new_paths):
+        """Append paths, computing only their rows and columns and updating the running averages in place."""
+        with timed(self.stats, 'metrics'):
+            pairs = self._total['count']
+            self._extend(new_paths)
+            count(self.stats, 'metric_pairs', self._total['count'] - pairs)
+        return self
+
+    def insert(self, index, path):
+        """Insert one path at index; the paths from index on move down one place."""
+        self.extend([path])
+        last = len(self.paths) - 1
+        if index < last:
+            with timed(self.stats, 'metrics'):
+                self._reorder(list(range(index)) + [last] + list(range(index, last)))
+        return self
+
+    def _reorder(self, order):
+        # Permute the known pair values; only the labels and the running averages are rebuilt
+        self.paths[:] = [self.paths[i] for i in order]
+        k = len(order)
+        index = np.asarray(order)
+        matrices = self._matrices[:, :k, :k][:, index][:, :, index]
+        self._matrices[:, :k, :k] = matrices
+        self._weighted, self._pattern = self._weighted[index], self._pattern[index]
+        self._distance, self._travel_time = self._distance[index], self._travel_time[index]
+        self._pair_rows = {}
+        self._path_metrics = {}
+        self._total = {'cd': 0, 'po': 0, 'tt_ab': 0, 'df': 0, 'count': 0}
+        self._accumulate(0, [matrix.tolist() for matrix in matrices], [])
+
+    def _grow(self, k):
+        # The matrices are views of one buffer that doubles when full, so adding paths only writes their rows and columns
+        old = len(self.cd)
+        if k > self._matrices.shape[1]:
+            capacity = max(k, 2 * self._matrices.shape[1])
+            matrices = np.zeros((4, capacity, capacity))
+            matrices[:, :old, :old] = self._matrices[:, :old, :old]
+            self._matrices = matrices
+        self.cd, self.po, self.tt_ab, self.df = self._matrices[:, :k, :k]
+
+    def _extend(self, new_paths):
+        records = [_path_result(path, self.graph) for path in new_paths]
+        old, k = len(self.paths), len(self.paths) + len(records)
+        if not records:
+            return
+        self.paths.extend(records)
+
+        # New rows (new paths as main path) and new columns (earlier paths against the new ones)
+        weighted, pattern = _incidence(records, self.graph)
+        new_totals = _totals(records)
+        all_pattern = _stack(self._pattern, pattern)
+        all_totals = (np.concatenate([self._distance, new_totals[0]]), np.concatenate([self._travel_time, new_totals[1]]))
+        rows = _metric_block(new_totals, all_totals, _shared_distance(weighted, all_pattern))
+        columns = _metric_block((self._distance, self._travel_time), new_totals, _shared_distance(self._weighted, pattern))
+        self._grow(k)
+        self._matrices[:, old:k, :k] = rows
+        self._matrices[:, :old, old:k] = columns
+        self._weighted, self._pattern = _stack(self._weighted, weighted), all_pattern
+        self._distance, self._travel_time = all_totals
+        self._accumulate(old, [row.tolist() for row in rows], [column.tolist() for column in columns])
+
+    def _accumulate(self, old, rows, columns):
+        # Visit only the pairs with a path from index old on, in the order a computation from scratch would.
+        # rows holds the four metrics of paths old.. against every path, columns those of paths ..old - 1 against paths old..
+        k = len(self.paths)
+        path_metrics = self._path_metrics
+        total = self._total
+        for i in range(old, k):
+            path_metrics[i] = {'cd': 0, 'po': 0, 'tt_ab': 0, 'df': 0, 'count': 0}  # Add df to metrics
+        for i in range(k):
+            block, row, offset = (columns, i, old) if i < old else (rows, i - old, 0)
+            cd_row, po_row, tt_ab_row, df_row = (matrix[row] for matrix in block)
+            for j in range(max(i + 1, old), k):
+                cd = cd_row[j - offset]
+                po = po_row[j - offset]
+                tt_ab = tt_ab_row[j - offset]
+                df = df_row[j - offset]  # Detour factor
+                self._pair_rows[(i, j)] = (f"Path {i + 1} vs Path {j + 1}", cd, po, tt_ab, df)  # Add df to results
+
+                # Accumulate totals for averages
+                total['cd'] += cd
+                total['po'] += po
+                total['tt_ab'] += tt_ab
+                total['df'] += df  # Add to total
+                total['count'] += 1
+
+                # Update path metrics
+                path_metrics[i]['cd'] += cd
+                path_metrics[i]['po'] += po
+                path_metrics[i]['tt_ab'] += tt_ab
+                path_metrics[i]['df'] += df  # Add df to path metrics
+                path_metrics[i]['count'] += 1
+                path_metrics[j]['cd'] += cd
+                path_metrics[j]['po'] += po
+                path_metrics[j]['tt_ab'] += tt_ab
+                path_metrics[j]['df'] += df  # Add df to path metrics
+                path_metrics[j]['count'] += 1
+        self.pairwise = [self._pair_rows[pair] for pair in sorted(self._pair_rows)]
+
+        # Calculate average metrics for each path (the list is swapped in whole, so a reader
+        # on another thread never sees it half built)
+        averages = []
+        for i in range(k):
+            if path_metrics[i]['count'] > 0:
+                avg_path_cd = path_metrics[i]['cd'] / path_metrics[i]['count']
+                avg_path_po = path_metrics[i]['po'] / path_metrics[i]['count']
+                avg_path_tt_ab = path_metrics[i]['tt_ab'] / path_metrics[i]['count']
+                avg_path_df = path_metrics[i]['df'] / path_metrics[i]['count']  # Calculate average df
+                averages.append((f"Path {i + 1} Averages", avg_path_cd, avg_path_po, avg_path_tt_ab, avg_path_df))  # Add df to averages
+        self.averages = averages
+
+        pairs = total['count']
+        self.overall = (total['cd'] / pairs, total['po'] / pairs, total['tt_ab'] / pairs, total['df'] / pairs) if pairs else None
+
+    def results(self):
+        """Pairwise rows followed by the per-path averages (the test_diversity_metrics list)."""
+        return self.pairwise + self.averages
+
+def test_diversity_metrics(sorted_paths, graph, stats=None):
     """Test the diversity metrics for all pairs of paths and return results."""
-    results = []
-    total_cd = 0
-    total_po = 0
-    total_tt_ab = 0
-    total_df = 0  # Add total detour factor
-    count = 0
-    path_metrics = {i: {'cd': 0, 'po': 0, 'tt_ab': 0, 'df': 0, 'count': 0} for i in range(len(sorted_paths))}  # Add df to metrics
-
-    for i in range(len(sorted_paths)):
-        for j in range(i + 1, len(sorted_paths)):
-            main_path = sorted_paths[i]
-            alternative_path = sorted_paths[j]
-            cd = cost_absolute_difference(main_path, alternative_path, graph)
-            po = path_overlap_analysis(main_path, alternative_path, graph)
-            tt_ab = travel_time_absolute_difference(main_path, alternative_path, graph)
-            df = detour_factor(main_path, alternative_path, graph)  # Calculate detour factor
-            results.append((f"Path {i + 1} vs Path {j + 1}", cd, po, tt_ab, df))  # Add df to results
-            
-            # Accumulate totals for averages
-            total_cd += cd
-            total_po += po
-            total_tt_ab += tt_ab
-            total_df += df  # Add to total
-            count += 1
-            
-            # Update path metrics
-            path_metrics[i]['cd'] += cd
-            path_metrics[i]['po'] += po
-            path_metrics[i]['tt_ab'] += tt_ab
-            path_metrics[i]['df'] += df  # Add df to path metrics
-            path_metrics[i]['count'] += 1
-            path_metrics[j]['cd'] += cd
-            path_metrics[j]['po'] += po
-            path_metrics[j]['tt_ab'] += tt_ab
-            path_metrics[j]['df'] += df  # Add df to path metrics
-            path_metrics[j]['count'] += 1
-
-    # Calculate and append average metrics for each path
-    for i in range(len(sorted_paths)):
-        if path_metrics[i]['count'] > 0:
-            avg_path_cd = path_metrics[i]['cd'] / path_metrics[i]['count']
-            avg_path_po = path_metrics[i]['po'] / path_metrics[i]['count']
-            avg_path_tt_ab = path_metrics[i]['tt_ab'] / path_metrics[i]['count']
-            avg_path_df = path_metrics[i]['df'] / path_metrics[i]['count']  # Calculate average df
-            results.append((f"Path {i + 1} Averages", avg_path_cd, avg_path_po, avg_path_tt_ab, avg_path_df))  # Add df to averages
-
-    return results
+    return DiversityMetrics(sorted_paths, graph, stats=stats).results()
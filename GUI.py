@@ -1,17 +1,101 @@
 import sys
+from bisect import bisect_right
 from collections import defaultdict
 from PySide6.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QLabel, QPushButton, 
     QLineEdit, QTabWidget, QHBoxLayout, QStackedWidget, QSizePolicy, 
-    QScrollArea, QMessageBox, QTableWidget, QTableWidgetItem, QHeaderView, QTextEdit, QComboBox, QAbstractItemView
+    QScrollArea, QMessageBox, QTableWidget, QTableWidgetItem, QHeaderView, QTextEdit, QComboBox, QAbstractItemView,
+    QProgressBar, QCheckBox
 )
-from PySide6.QtCore import Qt, QSize
+from PySide6.QtCore import Qt, QObject, QSize, QThread, QTimer, Signal
 from PySide6.QtGui import QPixmap, QIcon
-from Graph import read_graph_from_files, Graph
-from Modified_BDA import k_shortest_paths
+from Graph import cost_model
+from Graph_Cache import is_compiled_graph_current, load_compiled_graph
+from Contraction_Hierarchy import load_contraction_hierarchy
+from Modified_BDA import PathSearch
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
-from Output import draw_graph_with_path, draw_full_graph
-from Diversity_Metric_Test import test_diversity_metrics
+from Output import RenderPool, draw_full_graph, get_path_renderer
+from Diversity_Metric_Test import DiversityMetrics
+from Result_Cache import ResultCache
+from Instrumentation import record_time, report, timed
+
+def cost_position(paths, path):
+    """Index at which path goes into paths sorted by cost (after those of equal cost, like a stable sort)."""
+    return bisect_right([other.cost for other in paths], path.cost)
+
+class QueryWorker(QObject):
+    """One k shortest paths query, run on a QThread so the window stays responsive.
+
+    The stages (checking the graph files, the path searches, the diversity metrics) are
+    reported through progress, and every new path is sent together with the metrics updated
+    to include it, so the output tabs fill in while later searches run. The entry keeps its
+    paths (and their metrics) in cost order, as k_shortest_paths returns them. cancel() stops the
+    query after the search in progress; the paths found until then are still finished
+    (and cached) as the result for the number of searches done.
+    """
+    progress = Signal(str, int, int)  # Stage, steps done, steps in total (0 while unknown)
+    graph_loaded = Signal(object, object, object)  # Graph, hierarchy and files, when the files changed on disk
+    path_found = Signal(object, object)  # PathResult, cache entry it was added to
+    failed = Signal(str)
+    finished = Signal(object, object)  # Cache key (None if nothing to cache), cache entry
+
+    def __init__(self, files, graph, hierarchy, entry, start, end, k, mode, route_cost, engine, diagnostics=False):
+        super().__init__()
+        self.files = files
+        self.graph = graph
+        self.hierarchy = hierarchy
+        self.entry = entry  # Cached result of the same query with a smaller k, or None
+        self.start, self.end, self.k = start, end, k
+        self.mode, self.route_cost, self.engine = mode, route_cost, engine
+        self.diagnostics = diagnostics  # Collect counters and timers for a new entry
+        self.cancelled = False  # Set from the GUI thread, checked between searches
+
+    def cancel(self):
+        self.cancelled = True
+
+    def run(self):
+        key, entry = None, None
+        try:
+            key, entry = self.run_query()
+        except Exception as error:
+            self.failed.emit(str(error))
+        self.finished.emit(key, entry)
+
+    def run_query(self):
+        graph, hierarchy, entry = self.graph, self.hierarchy, self.entry
+        stats = entry['stats'] if entry is not None else {} if self.diagnostics else None  # An entry keeps its stats
+
+        # Load: reuse the window's graph unless its files changed since it was loaded
+        self.progress.emit("Checking graph files", 0, 0)
+        with timed(stats, 'load'):
+            if not is_compiled_graph_current(*self.files):
+                self.progress.emit("Loading graph", 0, 0)
+                graph = load_compiled_graph(*self.files)
+                hierarchy = load_contraction_hierarchy(graph, self.files[1], build=False)
+                entry = None  # Found on the old graph
+                self.graph_loaded.emit(graph, hierarchy, self.files)
+        if entry is None:
+            search = PathSearch(graph, self.start, self.end, graph.pos, stats=stats, mode=self.mode, hierarchy=hierarchy,
+                                cost_model=self.route_cost, engine=self.engine)
+            metrics = DiversityMetrics([], graph, stats=stats)  # Computed once, shared by both metric tables
+            entry = {'search': search, 'paths': metrics.paths, 'images': {}, 'stats': stats, 'metrics': metrics}
+        search = entry['search']
+
+        # Search and metrics, one search at a time so a cancel is seen before the next one (even when
+        # the search repeats a path). The metrics follow each path, so every partial result is complete.
+        for searches in range(search.searches + 1, self.k + 1):
+            if self.cancelled:
+                break
+            self.progress.emit("Searching paths", search.searches, self.k)
+            for path in search.extend(searches):
+                self.progress.emit("Computing diversity metrics", search.searches, self.k)
+                entry['metrics'].insert(cost_position(entry['paths'], path), path)  # Also adds it to entry['paths']
+                self.path_found.emit(path, entry)
+
+        # A cancelled query is kept for the searches it got through; raising k later continues it
+        searches = search.searches if self.cancelled else self.k
+        key = ResultCache.key(graph, self.start, self.end, searches, self.route_cost, self.mode, self.engine)
+        return (key if searches else None), entry
 
 class MainWindow(QMainWindow):
     def __init__(self):
@@ -40,6 +124,25 @@ class MainWindow(QMainWindow):
         # Initialize graph and position variables
         self.graph = None
         self.pos = {}
+        self.hierarchy = None
+        self.loaded_files = None  # (coordinates file, graph file) the graph was loaded from
+        self.result_cache = ResultCache()  # Paths, metrics and map images of recent queries
+
+        # Path maps are rendered to PNG in worker processes and collected by a timer on the GUI thread.
+        # Only cards near the visible part of the output are rendered and hold a pixmap.
+        self.render_pool = None
+        self.path_cards = []  # Per card, in cost order: widget, title, image label, path, the cached images, render state
+        self.pending_renders = []  # (future, card or None, cached images dict, path node ids)
+        self.render_timer = QTimer(self)
+        self.render_timer.setInterval(30)
+        self.render_timer.timeout.connect(self.collect_rendered_images)
+
+        # Queries run on worker threads; only the latest one updates the output, older ones are cancelled
+        self.query_worker = None
+        self.query = {}  # Start, end, k and background image of the latest query
+        self.query_runs = []  # (worker, thread) of queries whose thread may still be running
+        self.query_summary = ""
+        self.query_stats = None  # Diagnostics of the shown query (see Instrumentation), None when not collected
 
         # Initialize input fields for graph and coordinates
         self.graph_input = QLineEdit()  # For graph file path
@@ -232,22 +335,40 @@ class MainWindow(QMainWindow):
         # Start Node Dropdown
         self.start_node_input = QComboBox()
         self.start_node_input.setStyleSheet("font-size: 16px; height: 30px;")
-        self.start_node_input.setFixedWidth(300)
+        self.start_node_input.setFixedWidth(200)
 
         # End Node Dropdown
         self.end_node_input = QComboBox()
         self.end_node_input.setStyleSheet("font-size: 16px; height: 30px;")
-        self.end_node_input.setFixedWidth(300)
+        self.end_node_input.setFixedWidth(200)
 
         # K Value Dropdown (1-10)
         self.k_value_input = QComboBox()
         self.k_value_input.setStyleSheet("font-size: 16px; height: 30px;")
-        self.k_value_input.setFixedWidth(300)
+        self.k_value_input.setFixedWidth(200)
+
+        # Search Mode Dropdown
+        self.search_mode_input = QComboBox()
+        self.search_mode_input.setStyleSheet("font-size: 16px; height: 30px;")
+        self.search_mode_input.setFixedWidth(200)
+
+        # Route Cost Dropdown
+        self.cost_model_input = QComboBox()
+        self.cost_model_input.setStyleSheet("font-size: 16px; height: 30px;")
+        self.cost_model_input.setFixedWidth(200)
+
+        # Algorithm Dropdown
+        self.engine_input = QComboBox()
+        self.engine_input.setStyleSheet("font-size: 16px; height: 30px;")
+        self.engine_input.setFixedWidth(200)
 
                 # Create vertical layouts for each input group
         start_node_group = QVBoxLayout()
         end_node_group = QVBoxLayout()
         k_value_group = QVBoxLayout()
+        search_mode_group = QVBoxLayout()
+        cost_model_group = QVBoxLayout()
+        engine_group = QVBoxLayout()
 
         # Create labels
         start_label = QLabel("Starting Location:")
@@ -256,10 +377,35 @@ class MainWindow(QMainWindow):
         end_label.setStyleSheet("font-size: 16px; font-weight: bold;")
         k_label = QLabel("Number of Routes:")
         k_label.setStyleSheet("font-size: 16px; font-weight: bold;")
+        search_mode_label = QLabel("Search Mode:")
+        search_mode_label.setStyleSheet("font-size: 16px; font-weight: bold;")
+        cost_model_label = QLabel("Route Cost:")
+        cost_model_label.setStyleSheet("font-size: 16px; font-weight: bold;")
+        engine_label = QLabel("Algorithm:")
+        engine_label.setStyleSheet("font-size: 16px; font-weight: bold;")
 
         # Populate the k_value_input with values from 1 to 10
         self.k_value_input.addItems([str(i) for i in range(1, 11)])
 
+        # Populate the search modes (item data is the k_shortest_paths mode)
+        self.search_mode_input.addItem("Dijkstra", "dijkstra")
+        self.search_mode_input.addItem("A* (coordinates)", "astar")
+        self.search_mode_input.addItem("ALT (landmarks)", "alt")
+
+        # Populate the cost models (item data is the Graph.cost_model name)
+        self.cost_model_input.addItem("Distance + Travel Time", "blend")
+        self.cost_model_input.addItem("Distance", "distance")
+        self.cost_model_input.addItem("Travel Time", "time")
+
+        # Populate the path engines (item data is the k_shortest_paths engine)
+        self.engine_input.addItem("Modified BDA", "mbda")
+        self.engine_input.addItem("Yen (exact)", "yen")
+
+        # Changing any input cancels the query still running for the old inputs
+        for combo in (self.start_node_input, self.end_node_input, self.k_value_input, self.search_mode_input,
+                      self.cost_model_input, self.engine_input):
+            combo.currentIndexChanged.connect(self.cancel_query)
+
         # Add labels and dropdowns to their respective groups
         start_node_group.addWidget(start_label)
         start_node_group.addWidget(self.start_node_input)
@@ -270,10 +416,22 @@ class MainWindow(QMainWindow):
         k_value_group.addWidget(k_label)
         k_value_group.addWidget(self.k_value_input)
 
+        search_mode_group.addWidget(search_mode_label)
+        search_mode_group.addWidget(self.search_mode_input)
+
+        cost_model_group.addWidget(cost_model_label)
+        cost_model_group.addWidget(self.cost_model_input)
+
+        engine_group.addWidget(engine_label)
+        engine_group.addWidget(self.engine_input)
+
         # Add the groups to the input fields layout
         input_fields_layout.addLayout(start_node_group)
         input_fields_layout.addLayout(end_node_group)
         input_fields_layout.addLayout(k_value_group)
+        input_fields_layout.addLayout(search_mode_group)
+        input_fields_layout.addLayout(cost_model_group)
+        input_fields_layout.addLayout(engine_group)
 
         # Add the input fields layout to the main layout
         input_layout.addLayout(input_fields_layout)
@@ -311,6 +469,7 @@ class MainWindow(QMainWindow):
         self.scroll_area_content = QWidget()
         self.scroll_area_layout = QVBoxLayout(self.scroll_area_content)
         self.scroll_area.setWidget(self.scroll_area_content)
+        self.scroll_area.verticalScrollBar().valueChanged.connect(self.update_visible_cards)  # Maps follow the viewport
         self.path_layout.addWidget(self.scroll_area)
         self.path_widget.setLayout(self.path_layout)
         self.tabs.addTab(self.path_widget, "Paths and Graph")
@@ -398,8 +557,37 @@ class MainWindow(QMainWindow):
         tab3_widget.setLayout(tab3_layout)
         self.tabs.addTab(tab3_widget, "Average Metrics")  # Add Tab 3 to the tab widget
 
+        # Tab 4: Diagnostics (counters and timers of the shown query, collected only when enabled)
+        self.diagnostics_checkbox = QCheckBox("Collect diagnostics (counters and timers) for new queries")
+        self.diagnostics_checkbox.setStyleSheet("font-size: 16px;")
+        self.diagnostics_table = QTableWidget()
+        self.diagnostics_table.setColumnCount(2)
+        self.diagnostics_table.setHorizontalHeaderLabels(["Measure", "Value"])
+        self.diagnostics_table.verticalHeader().setVisible(False)
+        self.diagnostics_table.setEditTriggers(QAbstractItemView.NoEditTriggers)  # Set to read-only
+        self.diagnostics_table.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeToContents)
+        self.diagnostics_table.horizontalHeader().setStretchLastSection(True)
+        tab4_layout = QVBoxLayout()
+        tab4_layout.addWidget(self.diagnostics_checkbox)
+        tab4_layout.addWidget(self.diagnostics_table)
+        tab4_widget = QWidget()
+        tab4_widget.setLayout(tab4_layout)
+        self.tabs.addTab(tab4_widget, "Diagnostics")
+
         back_button.setFixedWidth(100)
         output_layout.addWidget(back_button)
+
+        # Stage and progress of the running query
+        status_layout = QHBoxLayout()
+        self.query_status_label = QLabel()
+        self.query_status_label.setStyleSheet("font-size: 16px;")
+        self.query_progress_bar = QProgressBar()
+        self.query_progress_bar.setFixedWidth(300)
+        self.query_progress_bar.setTextVisible(False)
+        status_layout.addWidget(self.query_status_label)
+        status_layout.addWidget(self.query_progress_bar)
+        status_layout.addStretch()
+        output_layout.addLayout(status_layout)
         output_layout.addWidget(self.tabs)  
 
         output_widget = QWidget()
@@ -418,13 +606,27 @@ class MainWindow(QMainWindow):
             QMessageBox.warning(self, "Input Error", "Please provide both graph and coordinates file paths.")
             return
 
-        graph_dict, travel_times, self.pos = read_graph_from_files(nodes_filename, edges_filename)  # Unpack all three values
-        self.graph = Graph(graph_dict, travel_times, self.pos)  # Create an instance of Graph with travel_times
+        # Keep the loaded graph while its files are unchanged (a stat check), so repeated queries skip the reload
+        if (self.graph is not None and self.loaded_files == (nodes_filename, edges_filename)
+                and is_compiled_graph_current(nodes_filename, edges_filename)):
+            return
+
+        graph = load_compiled_graph(nodes_filename, edges_filename)  # Memory-mapped, recompiled only when the files change
+        hierarchy = load_contraction_hierarchy(graph, edges_filename, build=False)  # Offline preprocessed, if available
+        self.set_graph(graph, hierarchy, (nodes_filename, edges_filename))
+
+    def set_graph(self, graph, hierarchy, files):
+        previous = self.graph if self.loaded_files and self.loaded_files[1] == files[1] else None
+        self.graph = graph
+        self.loaded_files = files
+        if previous is not None and previous.fingerprint != self.graph.fingerprint:
+            self.result_cache.invalidate(previous.fingerprint)  # The files changed; drop results of the old graph
+        self.pos = self.graph.pos
+        self.hierarchy = hierarchy
         print("Graph and positions loaded successfully.")
     
     def process_k_shortest_paths(self):
-        # Read the graph data first
-        self.read_graph_from_files()  # Ensure the graph is loaded before proceeding
+        # The graph was loaded when it was selected; a query reloads it first if its files changed since
 
         # Get the start, end nodes, and k value
         start_node = self.start_node_input.currentText()  # Use currentText() instead of text()
@@ -454,97 +656,277 @@ class MainWindow(QMainWindow):
 
         # Call the k_shortest_paths function
         if start_node and end_node:
-            paths, paths_with_costs = k_shortest_paths(self.graph, start_node, end_node, k, self.pos)  # Now returns both
-            
+            search_mode = self.search_mode_input.currentData()  # Dijkstra, A* or ALT
+            route_cost = cost_model(self.cost_model_input.currentData())  # Distance, travel time or both
+            engine = self.engine_input.currentData()  # Modified BDA or Yen
+
             # Determine the background image based on the loaded graph
             background_image = "Resources/moa-bg.png" if "moa" in self.graph_input.text() else "Resources/araneta-bg.png"
-            
-            # Pass the necessary variables including the background image
-            self.display_paths(paths, start_node, end_node, paths_with_costs, background_image)  
-            
-            # Call the diversity metrics function and display results
-            self.display_diversity_metrics(paths)  # Existing method to display diversity metrics
-            self.display_average_metrics(paths)  # New method to display average metrics
-
-    def display_paths(self, paths, start_node, end_node, paths_with_costs, background_image):
+
+            # Repeated queries are served from the result cache, map images included (the quick
+            # stat check skips the cache when the files changed; the worker reloads them first)
+            self.cancel_query()
+            self.clear_path_cards()
+            self.query = {'start': start_node, 'end': end_node, 'k': k, 'background': background_image}
+            self.query_stats = None
+            cache_key = ResultCache.key(self.graph, start_node, end_node, k, route_cost, search_mode, engine)
+            graph_current = is_compiled_graph_current(*self.loaded_files)
+            cached = self.result_cache.get(cache_key) if graph_current else None
+            if cached is not None:
+                for i, path in enumerate(cached['paths']):
+                    self.add_path_card(i, path, start_node, end_node, background_image, cached['images'])
+                self.finish_query_output(cached)
+                return
+
+            # The same query with a smaller k is extended: its paths, images and metrics are shown at once
+            cached = self.result_cache.take_smaller(cache_key) if graph_current else None
+            if cached is not None:
+                for i, path in enumerate(cached['paths']):
+                    self.add_path_card(i, path, start_node, end_node, background_image, cached['images'])
+                self.display_diversity_metrics(cached['metrics'])
+                self.display_average_metrics(cached['metrics'])
+            else:
+                self.display_diversity_metrics(DiversityMetrics([], self.graph))  # Clear the previous query's tables
+                self.display_average_metrics(DiversityMetrics([], self.graph))
+
+            # Load, search and metrics run on a worker thread; new path cards and metrics arrive through its signals
+            worker = QueryWorker(self.loaded_files, self.graph, self.hierarchy, cached, start_node, end_node, k,
+                                 search_mode, route_cost, engine, diagnostics=self.diagnostics_checkbox.isChecked())
+            thread = QThread(self)
+            worker.moveToThread(thread)
+            thread.started.connect(worker.run)
+            worker.progress.connect(self.show_query_progress)
+            worker.graph_loaded.connect(self.adopt_loaded_graph)
+            worker.path_found.connect(self.add_found_path)
+            worker.failed.connect(self.show_query_error)
+            worker.finished.connect(self.finish_query)
+            worker.finished.connect(thread.quit)
+            thread.finished.connect(self.forget_query_run)
+            thread.finished.connect(worker.deleteLater)
+            thread.finished.connect(thread.deleteLater)
+            self.query_runs.append((worker, thread))
+            self.query_worker = worker
+            thread.start()
+
+    def cancel_query(self, *args):
+        # A new query or changed inputs: the running query stops after its current search
+        if self.query_worker is not None:
+            self.query_worker.cancel()
+            self.query_worker = None
+            self.set_query_status("Cancelled.", 0, 1)
+
+    def forget_query_run(self):
+        # The thread has stopped; it and its worker are deleted once control returns to the event loop
+        self.query_runs = [(worker, thread) for worker, thread in self.query_runs if thread is not self.sender()]
+
+    def set_query_status(self, text, done, total):
+        self.query_status_label.setText(text)
+        self.query_progress_bar.setRange(0, total)  # A total of 0 shows a busy indicator
+        self.query_progress_bar.setValue(done)
+
+    def show_query_progress(self, stage, done, total):
+        if self.sender() is self.query_worker:
+            self.set_query_status(f"{stage}... {done}/{total}" if total else f"{stage}...", done, total)
+
+    def adopt_loaded_graph(self, graph, hierarchy, files):
+        if self.sender() is self.query_worker:
+            self.set_graph(graph, hierarchy, files)
+
+    def add_found_path(self, path, entry):
+        if self.sender() is not self.query_worker:
+            return
+        query = self.query
+        self.query_stats = entry['stats']  # Render times of the new cards are added on this thread
+        position = cost_position([card['path'] for card in self.path_cards], path)  # Same place as in entry['paths']
+        self.add_path_card(position, path, query['start'], query['end'], query['background'],
+                           entry['images'])  # Its map follows from the render pool
+        self.display_diversity_metrics(entry['metrics'])
+        self.display_average_metrics(entry['metrics'])
+
+    def show_query_error(self, message):
+        if self.sender() is self.query_worker:
+            QMessageBox.warning(self, "Search Error", f"The search failed: {message}")
+
+    def finish_query(self, key, entry):
+        if entry is not None:
+            self.result_cache.put(key, entry)
+        if self.sender() is not self.query_worker:
+            return  # Cancelled; its result was only cached
+        self.query_worker = None
+        if entry is not None:
+            self.finish_query_output(entry)
+        else:
+            self.set_query_status("Search failed.", 0, 1)
+
+    def finish_query_output(self, entry):
+        self.finish_path_cards(len(entry['paths']), self.query['k'])
+
+        # Call the diversity metrics function and display results
+        self.display_diversity_metrics(entry['metrics'])  # Existing method to display diversity metrics
+        self.display_average_metrics(entry['metrics'])  # New method to display average metrics
+        self.query_summary = f"Found {len(entry['paths'])} path(s)."
+        self.query_stats = entry['stats']
+        self.display_diagnostics(self.query_stats)
+        self.update_render_status()
+
+    def clear_path_cards(self):
         # Clear previous output
         for i in reversed(range(self.scroll_area_layout.count())): 
             widget = self.scroll_area_layout.itemAt(i).widget()
             if widget is not None:
+                widget.setParent(None)  # Detach at once; new cards are painted before control returns to the event loop
                 widget.deleteLater()  # Remove previous output widgets
 
-        # Get the number of paths requested
-        requested_paths_count = int(self.k_value_input.currentText()) if self.k_value_input.currentText().isdigit() else 1
-
-        if paths:
-            for i, path in enumerate(paths):
-                # Initialize cumulative values
-                cumulative_weight = 0
-                cumulative_travel_time = 0
-
-                # Create a new widget to hold the path text and graph
-                output_widget = QWidget()
-                output_layout = QVBoxLayout(output_widget)
-                self.scroll_area_layout.addWidget(output_widget)
-
-                # Create a table for segment details
-                segment_table = QTableWidget()
-                segment_table.setColumnCount(5)
-                segment_table.setHorizontalHeaderLabels(["Segment", "Weight (Distance)", "Cumulative Weight", "Travel Time", "Cumulative Travel Time"])
-                segment_table.setRowCount(len(path) - 1)  # Number of segments is one less than the number of nodes
-                segment_table.setEditTriggers(QAbstractItemView.NoEditTriggers)  # Set to read-only
-
-                # Fill the table with segment details
-                for j in range(len(path) - 1):
-                    segment = f"{path[j]} to {path[j + 1]}"
-                    weight = self.graph.edges[path[j]][path[j + 1]]
-                    travel_time = self.graph.travel_times[path[j]][path[j + 1]]
-
-                    # Update cumulative values
-                    cumulative_weight += weight
-                    cumulative_travel_time += travel_time
-
-                    # Insert data into the table
-                    segment_table.setItem(j, 0, QTableWidgetItem(segment))
-                    segment_table.setItem(j, 1, QTableWidgetItem(f"{weight} meters"))
-                    segment_table.setItem(j, 2, QTableWidgetItem(f"{cumulative_weight} meters"))
-                    segment_table.setItem(j, 3, QTableWidgetItem(f"{travel_time:.2f} seconds"))
-                    segment_table.setItem(j, 4, QTableWidgetItem(f"{cumulative_travel_time:.2f} seconds"))
-
-                # Set the table to resize to fit the content
-                segment_table.resizeColumnsToContents()
-                segment_table.resizeRowsToContents()
-
-                # Disable scrollbars
-                segment_table.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
-                segment_table.setVerticalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
-                
-                # Adjust the table to fit its contents fully
-                buffer_width = 15  # Set a smaller buffer width to extend the table size
-                segment_table.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Minimum)
-                segment_table.setFixedSize(
-                    segment_table.horizontalHeader().length() + segment_table.verticalHeader().width() + buffer_width,
-                    segment_table.verticalHeader().length() + segment_table.horizontalHeader().height()
-                )
-
-                # Create the path text label before the table
-                path_text = QTextEdit(f"Path {i + 1}: {' ➜ '.join(path)} <br>(Distance: {cumulative_weight} meters, Travel Time: {cumulative_travel_time:.2f} seconds)")
-                path_text.setStyleSheet("font-size: 16px; margin-bottom: 10px;")
-                path_text.setReadOnly(True)  # Make it read-only to prevent editing
-                output_layout.addWidget(path_text)  # Add the path text label to the output layout
-
-                # Add the segment table to the output layout
-                output_layout.addWidget(segment_table)
-
-                # Draw the graph and get the figure
-                fig = draw_graph_with_path(self.graph, path, i + 1, self.pos, start_node, end_node, cumulative_weight, background_image)
-                canvas = FigureCanvas(fig)
-                canvas.setFixedSize(1000, 600)  # Set a fixed size for the canvas to prevent squeezing
-                output_layout.addWidget(canvas, alignment=Qt.AlignCenter)
+        # Renders still in flight only fill the result cache now
+        self.path_cards = []
+        self.pending_renders = [(future, None, images, key) for future, _, images, key in self.pending_renders]
+
+    def add_path_card(self, i, path, start_node, end_node, background_image, images):
+        # path is a PathResult; its segment values and totals are precomputed
+        segments = path.segments()
+
+        # Create a new widget to hold the path text and graph, at position i among the cards
+        output_widget = QWidget()
+        output_layout = QVBoxLayout(output_widget)
+        self.scroll_area_layout.insertWidget(i, output_widget)
+
+        # Create a table for segment details
+        segment_table = QTableWidget()
+        segment_table.setColumnCount(5)
+        segment_table.setHorizontalHeaderLabels(["Segment", "Weight (Distance)", "Cumulative Weight", "Travel Time", "Cumulative Travel Time"])
+        segment_table.setRowCount(len(segments))  # One row per edge of the path
+        segment_table.setEditTriggers(QAbstractItemView.NoEditTriggers)  # Set to read-only
+
+        # Fill the table with segment details
+        for j, (from_node, to_node, weight, travel_time) in enumerate(segments):
+            segment = f"{from_node} to {to_node}"
+            cumulative_weight = path.cumulative_distance[j + 1]
+            cumulative_travel_time = path.cumulative_travel_time[j + 1]
+
+            # Insert data into the table
+            segment_table.setItem(j, 0, QTableWidgetItem(segment))
+            segment_table.setItem(j, 1, QTableWidgetItem(f"{weight} meters"))
+            segment_table.setItem(j, 2, QTableWidgetItem(f"{cumulative_weight} meters"))
+            segment_table.setItem(j, 3, QTableWidgetItem(f"{travel_time:.2f} seconds"))
+            segment_table.setItem(j, 4, QTableWidgetItem(f"{cumulative_travel_time:.2f} seconds"))
+
+        # Set the table to resize to fit the content
+        segment_table.resizeColumnsToContents()
+        segment_table.resizeRowsToContents()
+
+        # Disable scrollbars
+        segment_table.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
+        segment_table.setVerticalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
+        
+        # Adjust the table to fit its contents fully
+        buffer_width = 15  # Set a smaller buffer width to extend the table size
+        segment_table.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Minimum)
+        segment_table.setFixedSize(
+            segment_table.horizontalHeader().length() + segment_table.verticalHeader().width() + buffer_width,
+            segment_table.verticalHeader().length() + segment_table.horizontalHeader().height()
+        )
+
+        # Create the path text label before the table
+        path_text = QTextEdit()
+        path_text.setStyleSheet("font-size: 16px; margin-bottom: 10px;")
+        path_text.setReadOnly(True)  # Make it read-only to prevent editing
+        output_layout.addWidget(path_text)  # Add the path text label to the output layout
+
+        # Add the segment table to the output layout
+        output_layout.addWidget(segment_table)
+
+        # Reserve the map's space; the map itself is rendered once the card comes near the viewport
+        image_label = QLabel("Rendering map...")
+        image_label.setAlignment(Qt.AlignCenter)
+        image_label.setFixedSize(1000, 600)  # Set a fixed size for the image to prevent squeezing
+        output_layout.addWidget(image_label, alignment=Qt.AlignCenter)
+        self.path_cards.insert(i, {'widget': output_widget, 'title': path_text, 'image_label': image_label, 'path': path,
+                                   'images': images, 'start': start_node, 'end': end_node, 'background': background_image,
+                                   'shown': False, 'rendering': False})
+        for number, card in enumerate(self.path_cards[i:], i + 1):  # The cards after it move down one number
+            card['title'].setHtml(f"Path {number}: {' ➜ '.join(card['path'])} <br>(Distance: {card['path'].distance} meters, "
+                                  f"Travel Time: {card['path'].travel_time:.2f} seconds)")
+        QTimer.singleShot(0, self.update_visible_cards)  # After the scroll area has laid out the new card
+
+    def update_visible_cards(self):
+        # Show the maps of cards within one viewport height of the visible area and release the others
+        viewport_height = self.scroll_area.viewport().height()
+        top = self.scroll_area.verticalScrollBar().value() - viewport_height
+        bottom = self.scroll_area.verticalScrollBar().value() + 2 * viewport_height
+        for card in self.path_cards:
+            geometry = card['widget'].geometry()  # In scroll content coordinates
+            near = geometry.bottom() >= top and geometry.top() <= bottom
+            if near and not card['shown']:
+                self.show_card_image(card)
+            elif not near and card['shown']:
+                card['image_label'].clear()  # Drop the decoded pixmap; the PNG stays in the result cache
+                card['image_label'].setText("Rendering map...")
+                card['shown'] = False
+
+    def show_card_image(self, card):
+        card['shown'] = True
+        image = card['images'].get(card['path'].ids)
+        if image is not None:
+            self.set_path_image(card['image_label'], image)
+        elif not card['rendering']:
+            card['rendering'] = True
+            future = self.get_render_pool(card['background']).submit(card['path'], card['start'], card['end'])
+            self.pending_renders.append((future, card, card['images'], card['path'].ids))
+            self.render_timer.start()
+
+    def get_render_pool(self, background_image):
+        # One pool of render processes per base layer, replaced when the graph or background changes
+        renderer = get_path_renderer(self.graph, self.pos, background_image, figsize=(10, 6))  # 1000x600 images
+        if self.render_pool is None or self.render_pool.renderer is not renderer:
+            if self.render_pool is not None:
+                self.render_pool.shutdown()
+            self.render_pool = RenderPool(renderer)
+        return self.render_pool
+
+    def collect_rendered_images(self):
+        # Hand finished renders to their cards (and the result cache) on the GUI thread
+        pending = []
+        for future, card, images, key in self.pending_renders:
+            if not future.done():
+                pending.append((future, card, images, key))
+                continue
+            if card is not None:
+                card['rendering'] = False
+            if not future.cancelled() and future.exception() is None:
+                images[key], render_ms = future.result()
+                if card is not None and self.query_stats is not None:
+                    record_time(self.query_stats, 'render', render_ms, each=True)  # Per figure, in its render process
+                    if self.query_worker is None:
+                        self.display_diagnostics(self.query_stats)
+                if card is not None and card['shown']:
+                    self.set_path_image(card['image_label'], images[key])
+            elif card is not None:
+                card['image_label'].setText("The map could not be rendered.")
+        self.pending_renders = pending
+        if not pending:
+            self.render_timer.stop()
+        self.update_render_status()
+
+    def update_render_status(self):
+        # The render stage follows the query: report the maps still being drawn for the shown cards
+        if self.query_worker is not None or not self.query_summary:
+            return
+        rendering = sum(1 for _, card, _, _ in self.pending_renders if card is not None)
+        if rendering:
+            self.set_query_status(f"{self.query_summary} Rendering maps... {rendering} left", 0, 0)
+        else:
+            self.set_query_status(self.query_summary, 1, 1)
+
+    def set_path_image(self, image_label, image):
+        pixmap = QPixmap()
+        pixmap.loadFromData(image, "PNG")
+        image_label.setPixmap(pixmap)
 
+    def finish_path_cards(self, found_paths_count, requested_paths_count):
+        if found_paths_count:
             # Check if the number of produced paths is less than requested
-            if len(paths) < requested_paths_count:
-                no_more_paths_label = QLabel(f"No more paths found. Only {len(paths)} path(s) produced.")
+            if found_paths_count < requested_paths_count:
+                no_more_paths_label = QLabel(f"No more paths found. Only {found_paths_count} path(s) produced.")
                 no_more_paths_label.setStyleSheet("font-size: 16px; margin-top: 10px;")
                 self.scroll_area_layout.addWidget(no_more_paths_label)  # Add the message to the layout
         else:
@@ -552,19 +934,12 @@ class MainWindow(QMainWindow):
             no_paths_label.setStyleSheet("font-size: 16px;")
             self.scroll_area_layout.addWidget(no_paths_label)
 
-    def display_diversity_metrics(self, paths):
+    def display_diversity_metrics(self, metrics):
         # Clear previous table data
         self.diversity_table.setRowCount(0)
 
-        # Capture the output of the test_diversity_metrics function
-        results = test_diversity_metrics(paths, self.graph)
-
         # Only display the pairwise comparisons, excluding the averages
-        for result in results:
-            # Check if the result is an average
-            if "Averages" in result[0]:
-                continue
-
+        for result in metrics.pairwise:
             # Unpack the result tuple (now includes detour factor)
             path_comparison, cd, po, tt_ab, df = result  # Added df to unpacking
             row_position = self.diversity_table.rowCount()
@@ -577,12 +952,9 @@ class MainWindow(QMainWindow):
 
         self.diversity_table.setStyleSheet("font-size: 18px;")
 
-    def display_average_metrics(self, paths):
+    def display_average_metrics(self, metrics):
         # Clear previous table data
         self.average_metrics_table.setRowCount(0)
-        
-        # Capture the output of the test_diversity_metrics function
-        results = test_diversity_metrics(paths, self.graph)
 
         # Define thresholds
         distance_threshold = 20
@@ -595,51 +967,74 @@ class MainWindow(QMainWindow):
         narrative_text = ""
 
         # Extract average metrics for each path
-        for result in results:
-            if "Averages" in result[0]:
-                path_label, avg_cd, avg_po, avg_tt_ab, avg_df = result  # Added avg_df to unpacking
-                row_position = self.average_metrics_table.rowCount()
-                self.average_metrics_table.insertRow(row_position)
-                self.average_metrics_table.setItem(row_position, 0, QTableWidgetItem(path_label))
-                self.average_metrics_table.setItem(row_position, 1, QTableWidgetItem(f"{avg_cd:.2f}%"))
-                self.average_metrics_table.setItem(row_position, 2, QTableWidgetItem(f"{avg_tt_ab:.2f}%"))
-                self.average_metrics_table.setItem(row_position, 3, QTableWidgetItem(f"{avg_df:.2f}%"))
-                self.average_metrics_table.setItem(row_position, 4, QTableWidgetItem(f"{avg_po:.2f}%"))  # Rearranged order
-
-                # Add to narrative based on thresholds
-                narrative_text += f"<br><b>**{path_label}**:</b><br>"
-
-                # Evaluate cost difference
-                if avg_cd >= distance_threshold:
-                    narrative_text += f"- The absolute difference in distance is <b>{avg_cd:.2f}%</b>, indicating significant variation among paths.<br>"
-                else:
-                    narrative_text += f"- The absolute difference in distance is <b>{avg_cd:.2f}%</b>, suggesting paths are relatively similar in distance.<br>"
-
-                # Evaluate path overlap
-                if avg_po >= overlap_threshold_high:
-                    narrative_text += f"- The path overlap is <b>{avg_po:.2f}%</b>, indicating that the paths are very similar and may not provide diverse routing options.<br>"
-                elif avg_po <= overlap_threshold_low:
-                    narrative_text += f"- The path overlap is <b>{avg_po:.2f}%</b>, indicating a high level of diversity among the paths, which can enhance navigation options.<br>"
-                else:
-                    narrative_text += f"- The path overlap is <b>{avg_po:.2f}%</b>, suggesting moderate similarity among the paths, which may limit diversity.<br>"
-
-                # Evaluate travel time difference
-                if avg_tt_ab >= travel_time_threshold:
-                    narrative_text += f"- The travel time difference is <b>{avg_tt_ab:.2f}%</b>, suggesting that some paths may take significantly longer than others.<br>"
-                else:
-                    narrative_text += f"- The travel time difference is <b>{avg_tt_ab:.2f}%</b>, indicating that the paths are relatively consistent in travel time.<br>"
-
-                # Add detour factor analysis to narrative
-                narrative_text += f"- The detour factor is <b>{avg_df:.2f}%</b>, "
-                if avg_df >= detour_threshold:
-                    narrative_text += "indicating that alternative paths are significantly longer than the main path.<br>"
-                else:
-                    narrative_text += "suggesting that alternative paths maintain reasonable lengths compared to the main path.<br>"
+        for result in metrics.averages:
+            path_label, avg_cd, avg_po, avg_tt_ab, avg_df = result  # Added avg_df to unpacking
+            row_position = self.average_metrics_table.rowCount()
+            self.average_metrics_table.insertRow(row_position)
+            self.average_metrics_table.setItem(row_position, 0, QTableWidgetItem(path_label))
+            self.average_metrics_table.setItem(row_position, 1, QTableWidgetItem(f"{avg_cd:.2f}%"))
+            self.average_metrics_table.setItem(row_position, 2, QTableWidgetItem(f"{avg_tt_ab:.2f}%"))
+            self.average_metrics_table.setItem(row_position, 3, QTableWidgetItem(f"{avg_df:.2f}%"))
+            self.average_metrics_table.setItem(row_position, 4, QTableWidgetItem(f"{avg_po:.2f}%"))  # Rearranged order
+
+            # Add to narrative based on thresholds
+            narrative_text += f"<br><b>**{path_label}**:</b><br>"
+
+            # Evaluate cost difference
+            if avg_cd >= distance_threshold:
+                narrative_text += f"- The absolute difference in distance is <b>{avg_cd:.2f}%</b>, indicating significant variation among paths.<br>"
+            else:
+                narrative_text += f"- The absolute difference in distance is <b>{avg_cd:.2f}%</b>, suggesting paths are relatively similar in distance.<br>"
+
+            # Evaluate path overlap
+            if avg_po >= overlap_threshold_high:
+                narrative_text += f"- The path overlap is <b>{avg_po:.2f}%</b>, indicating that the paths are very similar and may not provide diverse routing options.<br>"
+            elif avg_po <= overlap_threshold_low:
+                narrative_text += f"- The path overlap is <b>{avg_po:.2f}%</b>, indicating a high level of diversity among the paths, which can enhance navigation options.<br>"
+            else:
+                narrative_text += f"- The path overlap is <b>{avg_po:.2f}%</b>, suggesting moderate similarity among the paths, which may limit diversity.<br>"
+
+            # Evaluate travel time difference
+            if avg_tt_ab >= travel_time_threshold:
+                narrative_text += f"- The travel time difference is <b>{avg_tt_ab:.2f}%</b>, suggesting that some paths may take significantly longer than others.<br>"
+            else:
+                narrative_text += f"- The travel time difference is <b>{avg_tt_ab:.2f}%</b>, indicating that the paths are relatively consistent in travel time.<br>"
+
+            # Add detour factor analysis to narrative
+            narrative_text += f"- The detour factor is <b>{avg_df:.2f}%</b>, "
+            if avg_df >= detour_threshold:
+                narrative_text += "indicating that alternative paths are significantly longer than the main path.<br>"
+            else:
+                narrative_text += "suggesting that alternative paths maintain reasonable lengths compared to the main path.<br>"
 
         # Update narrative label text
         self.narrative_label.setText(narrative_text)
         self.average_metrics_table.setStyleSheet("font-size: 18px;")
 
+    def display_diagnostics(self, stats):
+        # One row per counter or timer; lists (per search or per figure) are shown comma-separated
+        self.diagnostics_table.setRowCount(0)
+        if stats is None:
+            rows = [("Diagnostics", "Not collected for this query. Enable them above and run a new query.")]
+        else:
+            rows = [(name, ', '.join(str(item) for item in value) if isinstance(value, list) else str(value))
+                    for name, value in report(stats).items()]
+        for name, value in rows:
+            row_position = self.diagnostics_table.rowCount()
+            self.diagnostics_table.insertRow(row_position)
+            self.diagnostics_table.setItem(row_position, 0, QTableWidgetItem(name))
+            self.diagnostics_table.setItem(row_position, 1, QTableWidgetItem(value))
+
+    def closeEvent(self, event):
+        # Stop the query threads and the render processes with the window
+        self.cancel_query()
+        for worker, thread in self.query_runs:
+            worker.cancel()
+            thread.wait()
+        if self.render_pool is not None:
+            self.render_pool.shutdown()
+        super().closeEvent(event)
+
     def show_legend(self, title, content):
         """Show a legend in a pop-up window."""
         QMessageBox.information(self, title, content, QMessageBox.Ok)
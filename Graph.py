@@ -1,12 +1,212 @@
+from array import array
+from bisect import bisect_left
 from collections import defaultdict
 
+def cost_model(model='blend', distance_weight=1.0, time_weight=1.0):
+    """Return the (distance weight, time weight) pair of a cost model: 'distance', 'time' or a weighted 'blend'."""
+    if model == 'distance':
+        return (1.0, 0.0)
+    if model == 'time':
+        return (0.0, 1.0)
+    if model == 'blend':
+        return (float(distance_weight), float(time_weight))
+    raise ValueError(f"Unknown cost model: {model}")
+
 class Graph:
     def __init__(self, graph_dict, travel_times, pos=None):
-        self.edges = graph_dict
-        self.travel_times = travel_times  # Store travel times
-        self.visit_counts = defaultdict(lambda: defaultdict(int))
         self.pos = pos if pos is not None else {}  # Store node positions
-        self.nodes = list(graph_dict.keys())
+
+        # Intern node names as integer ids (sorted, so id order matches name order)
+        names = sorted(set(graph_dict.keys()) | set(self.pos.keys()))
+        node_ids = {name: i for i, name in enumerate(names)}
+
+        # Build the compressed sparse row arrays (neighbors of each node sorted by id)
+        offsets = array('i', [0])
+        targets = array('i')
+        weights = array('i')
+        times = array('d')
+        for name in names:
+            neighbors = graph_dict.get(name, {})
+            for neighbor in sorted(neighbors, key=node_ids.__getitem__):
+                targets.append(node_ids[neighbor])
+                weights.append(neighbors[neighbor])
+                times.append(travel_times[name][neighbor])
+            offsets.append(len(targets))
+
+        self._set_arrays(names, node_ids, offsets, targets, weights, times)
+
+    @classmethod
+    def from_arrays(cls, names, offsets, targets, weights, times, pos=None):
+        """Create a graph directly from prebuilt CSR arrays."""
+        graph = cls.__new__(cls)
+        graph.pos = pos if pos is not None else {}
+        graph._set_arrays(names, {name: i for i, name in enumerate(names)}, offsets, targets, weights, times)
+        return graph
+
+    def _set_arrays(self, names, node_ids, offsets, targets, weights, times):
+        self.node_names = names  # Node id -> node name
+        self.node_ids = node_ids  # Node name -> node id
+        self.offsets = offsets  # Edges of node u are the slots offsets[u]..offsets[u + 1] - 1
+        self.targets = targets  # Neighbor node id of each edge slot
+        self.weights = weights  # Distance (in m) of each edge slot
+        self.times = times  # Travel time (in seconds) of each edge slot
+        self.nodes = names
+        self.fingerprint = None  # Source hash, set when loaded from a compiled graph
+        self.derived = {}  # Data derived from the arrays on demand (search costs, landmarks)
+        self.cost_model = cost_model()  # Default (distance weight, time weight); queries pass cost_model= for another
+        self._edges = None
+        self._travel_times = None
+
+    def edge_costs(self, cost_model=None):
+        """Return the precomputed cost of every edge slot under a (distance weight, time weight) model."""
+        distance_weight, time_weight = cost_model or self.cost_model
+        key = ('edge_costs', distance_weight, time_weight)
+        if key not in self.derived:
+            self.derived[key] = array('d', (distance_weight * w + time_weight * t for w, t in zip(self.weights, self.times)))
+        return self.derived[key]
+
+    @property
+    def num_nodes(self):
+        return len(self.node_names)
+
+    @property
+    def num_edges(self):
+        return len(self.targets)
+
+    def edge_index(self, u, v):
+        """Return the edge slot of u -> v (node ids), or -1 if there is no such edge."""
+        lo, hi = self.offsets[u], self.offsets[u + 1]
+        i = bisect_left(self.targets, v, lo, hi)
+        if i < hi and self.targets[i] == v:
+            return i
+        return -1
+
+    def path_ids(self, path):
+        """Map a path of node names to node ids."""
+        return [self.node_ids[node] for node in path]
+
+    def path_names(self, path):
+        """Map a path of node ids to node names."""
+        return [self.node_names[u] for u in path]
+
+    def path_slots(self, path):
+        """Return the edge slots along a path of node names."""
+        return self.id_path_slots(self.path_ids(path))
+
+    def id_path_slots(self, ids):
+        """Return the edge slots along a path of node ids; KeyError if two consecutive nodes are not joined by an edge."""
+        slots = []
+        for i in range(len(ids) - 1):
+            slot = self.edge_index(ids[i], ids[i + 1])
+            if slot == -1:
+                raise KeyError(f"No edge {self.node_names[ids[i]]} -> {self.node_names[ids[i + 1]]}")
+            slots.append(slot)
+        return slots
+
+    @property
+    def edges(self):
+        # Name-keyed adjacency view, only materialized for callers that need it (drawing)
+        if self._edges is None:
+            self._edges = self._name_view(self.weights)
+        return self._edges
+
+    @property
+    def travel_times(self):
+        if self._travel_times is None:
+            self._travel_times = self._name_view(self.times)
+        return self._travel_times
+
+    def _name_view(self, values):
+        view = {}
+        for u, name in enumerate(self.node_names):
+            lo, hi = self.offsets[u], self.offsets[u + 1]
+            if lo < hi:
+                view[name] = {self.node_names[self.targets[e]]: values[e] for e in range(lo, hi)}
+        return view
+
+
+class PathResult:
+    """A found path with its totals and per-edge prefix sums computed once.
+
+    Iteration, indexing and len() go over the node names, so a result can be passed
+    wherever a list of node names is expected (drawing, joining, the metrics).
+    """
+
+    __slots__ = ('ids', 'names', 'slots', 'cost', 'cumulative_distance', 'cumulative_travel_time')
+
+    def __init__(self, graph, ids, cost):
+        self.ids = tuple(ids)  # Node ids along the path
+        self.names = graph.path_names(self.ids)
+        self.slots = array('i', graph.id_path_slots(self.ids))  # Edge slots
+        self.cost = cost  # Search cost under the cost model the path was found with
+        # Distance and travel time from the start up to each node (index 0 is the start)
+        self.cumulative_distance = array('q', [0])
+        self.cumulative_travel_time = array('d', [0])
+        for slot in self.slots:
+            self.cumulative_distance.append(self.cumulative_distance[-1] + graph.weights[slot])
+            self.cumulative_travel_time.append(self.cumulative_travel_time[-1] + graph.times[slot])
+
+    @property
+    def distance(self):
+        return self.cumulative_distance[-1]
+
+    @property
+    def travel_time(self):
+        return self.cumulative_travel_time[-1]
+
+    def segments(self):
+        """Return (from, to, distance, travel time) for each edge along the path."""
+        distance, travel_time = self.cumulative_distance, self.cumulative_travel_time
+        return [(self.names[i], self.names[i + 1], distance[i + 1] - distance[i], travel_time[i + 1] - travel_time[i])
+                for i in range(len(self.slots))]
+
+    def __len__(self):
+        return len(self.names)
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def __getitem__(self, index):
+        return self.names[index]
+
+    def __repr__(self):
+        return f"PathResult({' -> '.join(self.names)}, cost={self.cost})"
+
+
+class VisitCounts:
+    """Visit count of every edge slot, plus the smallest count among each node's edges.
+
+    The diversification filter only follows an edge whose count is the minimum among the
+    edges of its node. The minimum is kept up to date as edges are bumped, so the check is
+    a single comparison, and reads never add entries.
+    """
+
+    def __init__(self, offsets):
+        self.offsets = offsets
+        num_nodes = len(offsets) - 1
+        self.counts = array('i', bytes(4 * offsets[num_nodes]))  # Visit count of each edge slot
+        self.minimum = array('i', bytes(4 * num_nodes))  # Smallest count among each node's edge slots
+        self.at_minimum = array('i', (offsets[u + 1] - offsets[u] for u in range(num_nodes)))  # Slots holding it
+        self.total = 0  # Sum of all counts
+
+    def __getitem__(self, edge):
+        return self.counts[edge]
+
+    def allowed(self, node, edge):
+        """True if the edge slot of node has the node's lowest visit count."""
+        return self.counts[edge] <= self.minimum[node]
+
+    def bump(self, node, edge):
+        """Count one more visit of an edge slot of node."""
+        count = self.counts[edge]
+        self.counts[edge] = count + 1
+        self.total += 1
+        if count == self.minimum[node]:
+            self.at_minimum[node] -= 1
+            if self.at_minimum[node] == 0:
+                # Every slot at the old minimum moved up by one, so the minimum is now count + 1
+                self.minimum[node] = count + 1
+                self.at_minimum[node] = self.counts[self.offsets[node]:self.offsets[node + 1]].count(count + 1)
 
 
 def read_graph_from_files(nodes_filename, edges_filename):
@@ -54,3 +254,9 @@ def read_graph_from_files(nodes_filename, edges_filename):
                     raise
 
     return graph_dict, travel_times, pos
+
+
+def load_graph(nodes_filename, edges_filename):
+    """Read the graph files and build the array-backed Graph."""
+    graph_dict, travel_times, pos = read_graph_from_files(nodes_filename, edges_filename)
+    return Graph(graph_dict, travel_times, pos)
@@ -0,0 +1,174 @@
+import glob
+import hashlib
+import mmap
+import os
+import struct
+import sys
+import threading
+from array import array
+from Graph import Graph, read_graph_from_files
+
+# Compiled graph layout: header, then 8-byte aligned sections
+#   coords (2 * n doubles), times (m doubles), offsets (n + 1 ints),
+#   targets (m ints), weights (m ints), name offsets (n + 1 ints), names (utf-8)
+MAGIC = b'MBDAGRPH'
+VERSION = 1
+HEADER = struct.Struct('<8sIB3xIII4q32s')
+STATS = struct.Struct('<4q')  # The source mtimes and sizes inside the header
+STATS_OFFSET = struct.calcsize('<8sIB3xIII')
+
+def compiled_path(edges_filename):
+    """Return the compiled graph file that sits next to the edges file."""
+    return os.path.splitext(edges_filename)[0] + '.bin'
+
+def graph_file_pairs(directory):
+    """(nodes file, edges file) of every <name>-coordinates<N>.txt / <name>-graph<N>.txt pair in directory."""
+    pairs = []
+    for nodes_filename in sorted(glob.glob(os.path.join(directory, "*-coordinates*.txt"))):
+        edges_filename = nodes_filename.replace("-coordinates", "-graph")
+        if os.path.exists(edges_filename):
+            pairs.append((nodes_filename, edges_filename))
+    return pairs
+
+def _source_stats(nodes_filename, edges_filename):
+    nodes_stat = os.stat(nodes_filename)
+    edges_stat = os.stat(edges_filename)
+    return nodes_stat.st_mtime_ns, nodes_stat.st_size, edges_stat.st_mtime_ns, edges_stat.st_size
+
+def source_hash(nodes_filename, edges_filename):
+    """Hash both graph source files (used to tell stale compiled graphs apart)."""
+    digest = hashlib.sha256()
+    for filename in (nodes_filename, edges_filename):
+        with open(filename, 'rb') as file:
+            digest.update(file.read())
+    return digest.digest()
+
+def _align(size):
+    return (size + 7) & ~7
+
+def write_sections(filename, header, sections):
+    """Write a header and byte sections, each padded to 8 bytes, atomically replacing filename."""
+    # Write to a temporary file first so a concurrent reader never sees a half-written file. Each writer
+    # (process or thread) gets its own, so two writers of the same stale file do not clash.
+    temp_filename = f"{filename}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(temp_filename, 'wb') as file:
+            for data in (header, *sections):
+                file.write(data)
+                file.write(b'\0' * (_align(len(data)) - len(data)))
+        os.replace(temp_filename, filename)
+    except BaseException:
+        if os.path.exists(temp_filename):
+            os.unlink(temp_filename)  # Leave no partial file behind
+        raise
+    return filename
+
+def read_sections(mapped, header_size, layout):
+    """Views of the sections after the header of a mapped file, one per (size in bytes, array format or None)."""
+    view = memoryview(mapped)
+    position = _align(header_size)
+    sections = []
+    for size, fmt in layout:
+        data = view[position:position + size]
+        sections.append(data.cast(fmt) if fmt else data)
+        position += _align(size)
+    return sections
+
+def compile_graph(nodes_filename, edges_filename, compiled_filename=None):
+    """Parse the text graph files once and write the binary compiled graph."""
+    compiled_filename = compiled_filename or compiled_path(edges_filename)
+    stats = _source_stats(nodes_filename, edges_filename)
+    graph = Graph(*read_graph_from_files(nodes_filename, edges_filename))
+
+    nan = float('nan')
+    coords = array('d')
+    for name in graph.node_names:
+        x, y = graph.pos.get(name, (nan, nan))
+        coords.append(x)
+        coords.append(y)
+    encoded = [name.encode('utf-8') for name in graph.node_names]
+    name_offsets = array('i', [0])
+    for name in encoded:
+        name_offsets.append(name_offsets[-1] + len(name))
+    names = b''.join(encoded)
+
+    header = HEADER.pack(MAGIC, VERSION, sys.byteorder == 'little', graph.num_nodes, graph.num_edges,
+                         len(names), *stats, source_hash(nodes_filename, edges_filename))
+    sections = [coords.tobytes(), array('d', graph.times).tobytes(), array('i', graph.offsets).tobytes(),
+                array('i', graph.targets).tobytes(), array('i', graph.weights).tobytes(),
+                name_offsets.tobytes(), names]
+
+    write_sections(compiled_filename, header, sections)
+    return compiled_filename
+
+def _read_header(compiled_filename):
+    try:
+        with open(compiled_filename, 'rb') as file:
+            data = file.read(HEADER.size)
+    except OSError:
+        return None
+    if len(data) < HEADER.size:
+        return None
+    header = HEADER.unpack(data)
+    if header[0] != MAGIC or header[1] != VERSION or header[2] != (sys.byteorder == 'little'):
+        return None
+    return header
+
+def is_compiled_graph_current(nodes_filename, edges_filename, compiled_filename=None):
+    """Check the compiled graph against the source files (mtime and size first, then content hash)."""
+    header = _read_header(compiled_filename or compiled_path(edges_filename))
+    if header is None:
+        return False
+    stats = _source_stats(nodes_filename, edges_filename)
+    if tuple(header[6:10]) == stats:
+        return True
+    if header[10] != source_hash(nodes_filename, edges_filename):
+        return False
+    # Same content with new mtimes (a touch or a checkout): store them so later checks skip the hash
+    try:
+        with open(compiled_filename or compiled_path(edges_filename), 'r+b') as file:
+            file.seek(STATS_OFFSET)
+            file.write(STATS.pack(*stats))
+    except OSError:
+        pass  # A read-only compiled graph is still current, it just gets hashed again next time
+    return True
+
+def load_compiled_graph(nodes_filename, edges_filename, compiled_filename=None):
+    """Load the graph through its memory-mapped compiled file, recompiling it if the sources changed."""
+    compiled_filename = compiled_filename or compiled_path(edges_filename)
+    if not is_compiled_graph_current(nodes_filename, edges_filename, compiled_filename):
+        compile_graph(nodes_filename, edges_filename, compiled_filename)
+    return open_compiled_graph(compiled_filename)
+
+def open_compiled_graph(compiled_filename):
+    """Map a compiled graph file into memory and wrap its arrays in a Graph."""
+    with open(compiled_filename, 'rb') as file:
+        mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    header = HEADER.unpack_from(mapped)
+    if header[0] != MAGIC or header[1] != VERSION:
+        raise ValueError(f"Not a compiled graph file: {compiled_filename}")
+    num_nodes, num_edges, names_size = header[3:6]
+
+    coords, times, offsets, targets, weights, name_offsets, names_blob = read_sections(mapped, HEADER.size, [
+        (16 * num_nodes, 'd'), (8 * num_edges, 'd'), (4 * (num_nodes + 1), 'i'), (4 * num_edges, 'i'),
+        (4 * num_edges, 'i'), (4 * (num_nodes + 1), 'i'), (names_size, None)])
+    names_blob = bytes(names_blob)
+
+    names = [names_blob[name_offsets[i]:name_offsets[i + 1]].decode('utf-8') for i in range(num_nodes)]
+    pos = {}
+    for i, name in enumerate(names):
+        x, y = coords[2 * i], coords[2 * i + 1]
+        if x == x and y == y:  # NaN marks a node without coordinates
+            pos[name] = (x, y)
+
+    graph = Graph.from_arrays(names, offsets, targets, weights, times, pos)
+    graph.fingerprint = header[10].hex()
+    graph._mapped = mapped  # Keep the mapping alive as long as the graph
+    return graph
+
+
+if __name__ == "__main__":
+    # Compile every <name>-coordinates<N>.txt / <name>-graph<N>.txt pair in the given directories
+    for directory in sys.argv[1:] or ["Graphs"]:
+        for nodes_filename, edges_filename in graph_file_pairs(directory):
+            print(f"Compiled {compile_graph(nodes_filename, edges_filename)}")
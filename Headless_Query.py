@@ -0,0 +1,147 @@
+"""Run k shortest paths queries without the GUI and stream the results as JSON Lines or CSV.
+
+    python Headless_Query.py moa -k 5 < pairs.csv > results.jsonl
+    python Headless_Query.py Graphs/araneta-graph1.txt pairs.csv --format csv --engine yen
+    python Headless_Query.py moa pairs.csv --profile       # Adds each query's counters and timers
+
+Each input line is "start,end" or "start,end,k" (CSV quoting allowed; blank lines and
+lines starting with # are skipped). Only the search modules are imported at startup:
+no Qt, matplotlib or networkx, and numpy/scipy only once the first diversity metrics
+are computed (never with --no-metrics).
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+from Contraction_Hierarchy import load_contraction_hierarchy
+from Graph import cost_model
+from Graph_Cache import graph_file_pairs, load_compiled_graph
+from Instrumentation import report
+from Modified_BDA import ENGINES, SEARCH_MODES, k_shortest_paths
+
+GRAPHS_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Graphs")
+
+# One CSV row per (start, end, k) query; the metric columns average all pairwise comparisons
+CSV_COLUMNS = ('start', 'end', 'k', 'paths_found', 'best_cost', 'costs', 'paths',
+               'avg_cost_difference', 'avg_path_overlap', 'avg_travel_time_difference', 'avg_detour_factor')
+METRICS = ('cost_difference', 'path_overlap', 'travel_time_difference', 'detour_factor')
+
+def graph_files(graph):
+    """(coordinates file, graph file) for a graph file path or a name in Graphs/ such as 'moa' or 'moa-graph1'."""
+    if os.path.exists(graph):
+        matches = [pair for pair in graph_file_pairs(os.path.dirname(graph) or '.') if os.path.samefile(pair[1], graph)]
+    else:
+        matches = [pair for pair in graph_file_pairs(GRAPHS_DIRECTORY)
+                   if os.path.basename(pair[1]) == f"{graph}.txt" or os.path.basename(pair[1]).startswith(f"{graph}-graph")]
+    if not matches:
+        raise FileNotFoundError(f"No graph file found for {graph!r}")
+    return matches[0]
+
+def read_queries(lines, k):
+    """Yield (start, end, k) for every query line; k defaults to the given k."""
+    for number, row in enumerate(csv.reader(lines), 1):
+        if not row or not row[0].strip() or row[0].lstrip().startswith('#'):
+            continue
+        if len(row) not in (2, 3) or (len(row) == 3 and not row[2].strip().isdigit()):
+            raise ValueError(f"Line {number}: expected start,end or start,end,k")
+        yield row[0].strip(), row[1].strip(), int(row[2]) if len(row) == 3 else k
+
+def run_queries(graph, queries, mode='dijkstra', hierarchy=None, route_cost=None, engine='mbda', metrics=True,
+                profile=False):
+    """Yield (start, end, k, sorted paths, DiversityMetrics or None, stats or None) for each query, as it finishes."""
+    diversity_metrics = None
+    for start, end, k in queries:
+        if start not in graph.node_ids or end not in graph.node_ids:
+            print(f"Unknown node in query {start!r} -> {end!r}", file=sys.stderr)
+        stats = {} if profile else None  # Counters and timers (see Instrumentation)
+        paths, _ = k_shortest_paths(graph, start, end, k, graph.pos, stats=stats, mode=mode, hierarchy=hierarchy,
+                                    cost_model=route_cost, engine=engine)
+        if metrics and diversity_metrics is None:
+            from Diversity_Metric_Test import DiversityMetrics  # numpy (and scipy) load on first use only
+            diversity_metrics = DiversityMetrics
+        yield start, end, k, paths, diversity_metrics(paths, graph, stats=stats) if metrics else None, stats
+
+def _metric_fields(row):
+    # (label, cd, po, tt_ab, df) row of DiversityMetrics as named fields
+    return dict(zip(METRICS, row[1:]))
+
+def result_record(start, end, k, paths, metrics=None, stats=None):
+    """JSON-ready result of one query: its paths and (if given) its metrics and its counters and timers."""
+    record = {'start': start, 'end': end, 'k': k,
+              'paths': [{'nodes': list(path), 'cost': path.cost, 'distance': path.distance,
+                         'travel_time': path.travel_time} for path in paths]}
+    if metrics is not None:
+        record['metrics'] = {
+            'pairwise': [dict(pair=row[0], **_metric_fields(row)) for row in metrics.pairwise],
+            'averages': [dict(path=row[0], **_metric_fields(row)) for row in metrics.averages],
+            'overall': dict(zip(METRICS, metrics.overall)) if metrics.overall else None,
+        }
+    if stats is not None:
+        record['profile'] = report(stats)
+    return record
+
+def write_jsonl(results, file):
+    """One JSON object per query (see result_record)."""
+    for result in results:
+        file.write(json.dumps(result_record(*result)) + "\n")
+        file.flush()  # Stream: each result is readable as soon as its query finishes
+
+def summary_row(start, end, k, paths, metrics=None):
+    """The CSV_COLUMNS fields of one query; costs and paths are tuples, the averages None without metrics."""
+    averages = (metrics.overall if metrics is not None else None) or (None, None, None, None)
+    return (start, end, k, len(paths), paths[0].cost if paths else None, tuple(path.cost for path in paths),
+            tuple(tuple(path) for path in paths)) + tuple(averages)
+
+def write_csv(rows, file):
+    """Write summary rows as CSV; paths are written as 'A -> B -> C' joined by ' | '."""
+    writer = csv.writer(file)
+    writer.writerow(CSV_COLUMNS)
+    for row in rows:
+        row = list(row)
+        row[5] = ' | '.join(f"{cost:.2f}" for cost in row[5])
+        row[6] = ' | '.join(' -> '.join(path) for path in row[6])
+        writer.writerow(row)
+        file.flush()  # Stream: each row is readable as soon as its query finishes
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run k shortest paths queries and stream the results.")
+    parser.add_argument('graph', help="graph file, or a graph name in Graphs/ (e.g. moa, araneta-graph1)")
+    parser.add_argument('queries', nargs='?', default='-', help="file of start,end[,k] lines (default: stdin)")
+    parser.add_argument('-k', type=int, default=3, help="number of paths when a line gives no k (default: 3)")
+    parser.add_argument('-o', '--output', default='-', help="output file (default: stdout)")
+    parser.add_argument('--format', choices=('jsonl', 'csv'), default='jsonl')
+    parser.add_argument('--mode', choices=SEARCH_MODES, default='dijkstra')
+    parser.add_argument('--cost-model', choices=('blend', 'distance', 'time'), default=None,
+                        help="route cost (default: the graph's cost model)")
+    parser.add_argument('--engine', choices=ENGINES, default='mbda')
+    parser.add_argument('--no-hierarchy', action='store_true', help="do not use a preprocessed contraction hierarchy")
+    parser.add_argument('--no-metrics', action='store_true', help="skip the diversity metrics")
+    parser.add_argument('--profile', action='store_true', help="add each query's counters and timers (JSON Lines only)")
+    args = parser.parse_args(argv)
+
+    nodes_filename, edges_filename = graph_files(args.graph)
+    graph = load_compiled_graph(nodes_filename, edges_filename)  # Memory-mapped, compiled on first use
+    route_cost = cost_model(args.cost_model) if args.cost_model else None
+    hierarchy = None
+    if not args.no_hierarchy:
+        hierarchy = load_contraction_hierarchy(graph, edges_filename, build=False, cost_model=route_cost or graph.cost_model)
+
+    queries_file = sys.stdin if args.queries == '-' else open(args.queries, newline='')
+    output_file = sys.stdout if args.output == '-' else open(args.output, 'w', newline='')
+    try:
+        results = run_queries(graph, read_queries(queries_file, args.k), mode=args.mode, hierarchy=hierarchy,
+                              route_cost=route_cost, engine=args.engine, metrics=not args.no_metrics,
+                              profile=args.profile)
+        if args.format == 'csv':
+            write_csv((summary_row(*result[:5]) for result in results), output_file)
+        else:
+            write_jsonl(results, output_file)
+    finally:
+        for file in (queries_file, output_file):
+            if file not in (sys.stdin, sys.stdout):
+                file.close()
+
+
+if __name__ == "__main__":
+    main()
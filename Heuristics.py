@@ -0,0 +1,124 @@
+import math
+from array import array
+from Instrumentation import heap_functions
+
+INF = float('inf')
+
+def euclidean_scale(graph, pos, cost_model=None):
+    """Return the largest factor s with cost(u, v) >= s * |pos[u] - pos[v]| on every edge.
+
+    Scaling the straight-line distance by s turns map coordinates into a lower bound in
+    the graph's own cost units. Returns 0 when some node has no coordinates.
+    """
+    cost_model = cost_model or graph.cost_model
+    key = ('euclidean_scale',) + cost_model
+    if pos is not graph.pos or key not in graph.derived:
+        costs = graph.edge_costs(cost_model)
+        scale = INF
+        for u, name in enumerate(graph.node_names):
+            if name not in pos:
+                scale = 0
+                break
+            x1, y1 = pos[name]
+            for edge in range(graph.offsets[u], graph.offsets[u + 1]):
+                x2, y2 = pos[graph.node_names[graph.targets[edge]]]
+                length = math.hypot(x2 - x1, y2 - y1)
+                if length > 0:
+                    scale = min(scale, costs[edge] / length)
+        # Shave off a little so rounding can never make the bound exceed an edge cost
+        scale = 0 if scale == INF else scale * (1 - 1e-9)
+        if pos is not graph.pos:
+            return scale
+        graph.derived[key] = scale
+    return graph.derived[key]
+
+def single_source_costs(graph, source, cost_model=None):
+    """Dijkstra from source over the whole graph; returns the cost to every node."""
+    return shortest_path_tree(graph, source, cost_model)[0]
+
+def shortest_path_tree(graph, source, cost_model=None, stats=None):
+    """Dijkstra from source over the whole graph; returns (cost to source, next hop towards source) per node."""
+    costs = graph.edge_costs(cost_model)
+    push, pop = heap_functions(stats)
+    dist = array('d', [INF]) * graph.num_nodes
+    parent = array('i', [-1]) * graph.num_nodes
+    dist[source] = 0
+    heap = [(0, source)]
+    while heap:
+        d, u = pop(heap)
+        if d > dist[u]:
+            continue
+        for edge in range(graph.offsets[u], graph.offsets[u + 1]):
+            v = graph.targets[edge]
+            nd = d + costs[edge]
+            if nd < dist[v]:
+                dist[v] = nd
+                parent[v] = u
+                push(heap, (nd, v))
+    return dist, parent
+
+class Landmarks:
+    """Precomputed landmark distances for ALT lower bounds (graph edges are undirected)."""
+
+    def __init__(self, graph, count=8, cost_model=None):
+        self.cost_model = cost_model or graph.cost_model
+        self.nodes = []
+        self.distances = []
+        if graph.num_nodes == 0:
+            return
+        # Farthest-point selection: each landmark is the node farthest from those chosen so far
+        nearest = single_source_costs(graph, 0, self.cost_model)
+        for _ in range(min(count, graph.num_nodes)):
+            candidate = max(range(graph.num_nodes), key=lambda v: nearest[v] if nearest[v] < INF else -1)
+            if candidate in self.nodes:
+                break
+            dist = single_source_costs(graph, candidate, self.cost_model)
+            self.nodes.append(candidate)
+            self.distances.append(dist)
+            nearest = array('d', map(min, nearest, dist)) if len(self.nodes) > 1 else dist
+
+    def lower_bound(self, u, v):
+        """Triangle-inequality lower bound on the cost between nodes u and v."""
+        bound = 0
+        for dist in self.distances:
+            if dist[u] < INF and dist[v] < INF:
+                bound = max(bound, abs(dist[u] - dist[v]))
+        return bound
+
+def get_landmarks(graph, count=8, cost_model=None):
+    """Return the graph's landmarks for a cost model, computing them on first use."""
+    cost_model = cost_model or graph.cost_model
+    key = ('landmarks', count) + cost_model
+    if key not in graph.derived:
+        graph.derived[key] = Landmarks(graph, count, cost_model)
+    return graph.derived[key]
+
+def bidirectional_potential(graph, source, target, pos=None, landmarks=None, cost_model=None):
+    """Build the forward potential p(v) = (h_target(v) - h_source(v)) / 2 for a bidirectional search.
+
+    h is the larger of the scaled Euclidean bound (when pos is given) and the landmark
+    bound (when landmarks are given). The backward search uses -p, which keeps both
+    searches on the same non-negative reduced costs. Values are computed lazily per
+    node, so only the part of the graph the search touches is evaluated.
+    """
+    scale = euclidean_scale(graph, pos, cost_model) if pos else 0
+    names = graph.node_names
+    cache = array('d', [math.nan]) * graph.num_nodes
+
+    def heuristic(v, goal):
+        h = 0
+        if scale > 0:
+            x1, y1 = pos[names[v]]
+            x2, y2 = pos[names[goal]]
+            h = scale * math.hypot(x2 - x1, y2 - y1)
+        if landmarks is not None:
+            h = max(h, landmarks.lower_bound(v, goal))
+        return h
+
+    def potential(v):
+        p = cache[v]
+        if p != p:  # NaN: not computed yet
+            p = cache[v] = (heuristic(v, target) - heuristic(v, source)) / 2
+        return p
+
+    return potential
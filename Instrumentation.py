@@ -0,0 +1,73 @@
+"""Counters and timers of a query, collected only when the caller passes a stats dict.
+
+The searches, the diversity metrics and the renderer already take an optional stats
+dict (k_shortest_paths(stats=...), PathSearch, DiversityMetrics, render_path_png);
+these helpers add to it. Counters are plain keys ('heap_pushes', 'heap_pops',
+'visit_rejections', 'metric_pairs', next to 'settled_nodes'), and a timer adds
+milliseconds to '<name>_ms' and one to '<name>_count'. With stats=None nothing is
+counted: heap_functions hands out the plain heapq functions and timed() a shared
+no-op context, so the hot loops run as they did without instrumentation.
+"""
+import heapq
+import time
+from contextlib import nullcontext
+
+_NOT_TIMED = nullcontext()
+
+def count(stats, name, amount=1):
+    """Add amount to the counter name of stats (nothing when stats is None)."""
+    if stats is not None:
+        stats[name] = stats.get(name, 0) + amount
+
+def record_time(stats, name, milliseconds, each=False):
+    """Add one timing to '<name>_ms' and '<name>_count'; with each, also keep it in the '<name>_ms_each' list."""
+    if stats is None:
+        return
+    stats[f"{name}_ms"] = stats.get(f"{name}_ms", 0) + milliseconds
+    stats[f"{name}_count"] = stats.get(f"{name}_count", 0) + 1
+    if each:
+        stats.setdefault(f"{name}_ms_each", []).append(milliseconds)
+
+class _Timer:
+    __slots__ = ('stats', 'name', 'started')
+
+    def __init__(self, stats, name):
+        self.stats = stats
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        record_time(self.stats, self.name, (time.perf_counter() - self.started) * 1000)
+        return False
+
+def timed(stats, name):
+    """Context manager timing its block into stats (a no-op when stats is None)."""
+    return _NOT_TIMED if stats is None else _Timer(stats, name)
+
+def heap_functions(stats):
+    """(heappush, heappop) counting into stats['heap_pushes'] and stats['heap_pops']; the plain heapq ones without stats."""
+    if stats is None:
+        return heapq.heappush, heapq.heappop
+
+    def push(heap, item):
+        stats['heap_pushes'] = stats.get('heap_pushes', 0) + 1
+        heapq.heappush(heap, item)
+
+    def pop(heap):
+        stats['heap_pops'] = stats.get('heap_pops', 0) + 1
+        return heapq.heappop(heap)
+
+    return push, pop
+
+def report(stats):
+    """JSON-ready copy of a stats dict, sorted by name, with times rounded to microseconds."""
+    def value(item):
+        if isinstance(item, float):
+            return round(item, 3)
+        if not isinstance(item, (int, str)) and hasattr(item, '__iter__'):
+            return [value(element) for element in item]
+        return item
+    return {name: value(item) for name, item in sorted(stats.items())}
@@ -1,77 +1,235 @@
-import heapq
+from array import array
 from collections import defaultdict
+from operator import attrgetter
+from Graph import PathResult, VisitCounts
+from Heuristics import bidirectional_potential, get_landmarks
+from Instrumentation import count, heap_functions, timed
+from Yen_KSP import iter_yen_k_shortest_paths
 
-def k_shortest_paths(graph, start, end, k, pos):
-    found_paths = set()
-    paths_with_costs = []
-
-    def bidirectional_dijkstra():
-        forward_heap = [(0, start, [])]
-        backward_heap = [(0, end, [])]
-        forward_visited = {}
-        backward_visited = {}
-
-        while forward_heap and backward_heap:
-            # Forward search
-            dist, node, path = heapq.heappop(forward_heap)
-            if node in backward_visited:
-                merged_path = path + backward_visited[node][1][::-1]
-                full_path = tuple(merged_path)
-                return full_path, dist + backward_visited[node][0]
-
-            if node not in forward_visited:
-                forward_visited[node] = (dist, path + [node])
-                for neighbor, weight in graph.edges[node].items():
-                    travel_time = graph.travel_times[node][neighbor]  # Assume travel_times is a dict like edges
-                    total_weight = weight + travel_time  # Combine cost and travel time
-                    current_visit_count = graph.visit_counts[node][neighbor]
-                    if all(current_visit_count <= graph.visit_counts[node][other] for other in graph.edges[node]):
-                        heapq.heappush(forward_heap, (dist + total_weight, neighbor, path + [node]))
-
-            # Backward search
-            dist, node, path = heapq.heappop(backward_heap)
-            if node in forward_visited:
-                merged_path = forward_visited[node][1] + path[::-1]
-                full_path = tuple(merged_path)
-                return full_path, forward_visited[node][0] + dist
-
-            if node not in backward_visited:
-                backward_visited[node] = (dist, path + [node])
-                for neighbor, weight in graph.edges[node].items():
-                    travel_time = graph.travel_times[node][neighbor]  # Assume travel_times is a dict like edges
-                    total_weight = weight + travel_time  # Combine cost and travel time
-                    current_visit_count = graph.visit_counts[node][neighbor]
-                    if all(current_visit_count <= graph.visit_counts[node][other] for other in graph.edges[node]):
-                        heapq.heappush(backward_heap, (dist + total_weight, neighbor, path + [node]))
-
-        return None, None
-
-    def update_visit_counts(path):
+INF = float('inf')
+SEARCH_MODES = ('dijkstra', 'astar', 'alt')  # Plain, Euclidean lower bound, landmarks + Euclidean
+ENGINES = ('mbda', 'yen')  # Visit-count diversified bidirectional search, exact k shortest loopless paths
+
+class QuerySession:
+    """State of one diversified start -> end query over a shared graph.
+
+    The graph is only read; the visit counts that steer later searches away from earlier
+    paths belong to the session. A loaded graph can therefore serve many sessions at once
+    (one per thread), and every query starts from the same state.
+    """
+
+    def __init__(self, graph, source, target, pos=None, mode='dijkstra', landmarks=None, hierarchy=None, cost_model=None,
+                 stats=None):
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"Unknown search mode: {mode}")
+        self.graph = graph
+        self.source = source  # Node ids; names are mapped by the caller
+        self.target = target
+        self.cost_model = cost_model or graph.cost_model  # (distance weight, time weight), see Graph.cost_model
+        self.costs = graph.edge_costs(self.cost_model)
+        self.visit_counts = VisitCounts(graph.offsets)
+        self.hierarchy = hierarchy if hierarchy is not None and hierarchy.cost_model == self.cost_model else None
+        self.settled_per_search = []
+        self.stats = stats  # Instrumentation counters and timers (see Instrumentation), or None
+
+        # Goal-directed modes search on reduced costs using a potential built from the coordinates
+        # and/or landmark distances; the visit-count filter only removes edges, so it stays admissible
+        self.potential = None
+        if mode == 'astar':
+            self.potential = bidirectional_potential(graph, source, target, pos=pos, cost_model=self.cost_model)
+        elif mode == 'alt':
+            landmarks = landmarks or get_landmarks(graph, cost_model=self.cost_model)
+            self.potential = bidirectional_potential(graph, source, target, pos=pos, landmarks=landmarks,
+                                                     cost_model=self.cost_model)
+
+    def next_path(self):
+        """Find the next diversified path; returns (path of node ids, cost) or (None, None)."""
+        # With no visits recorded yet the visit-count filter keeps every edge, so the first
+        # (base) path is a plain shortest path that the contraction hierarchy can answer
+        with timed(self.stats, 'search'):
+            if self.hierarchy is not None and self.visit_counts.total == 0:
+                hierarchy_stats = {}
+                path, cost = self.hierarchy.shortest_path(self.source, self.target, hierarchy_stats)
+                self.settled_per_search.append(hierarchy_stats.get('settled_nodes', 0))
+                count(self.stats, 'heap_pushes', hierarchy_stats.get('heap_pushes', 0))
+                count(self.stats, 'heap_pops', hierarchy_stats.get('heap_pops', 0))
+            else:
+                path, cost = self.bidirectional_dijkstra()
+        if path is not None:
+            self.update_visit_counts(path)
+        return path, cost
+
+    def update_visit_counts(self, path):
+        graph = self.graph
         for i in range(len(path) - 1):
-            graph.visit_counts[path[i]][path[i + 1]] += 1
-            graph.visit_counts[path[i + 1]][path[i]] += 1
+            self.visit_counts.bump(path[i], graph.edge_index(path[i], path[i + 1]))
+            self.visit_counts.bump(path[i + 1], graph.edge_index(path[i + 1], path[i]))
+
+    def bidirectional_dijkstra(self):
+        source, target = self.source, self.target
+        if source == target:
+            self.settled_per_search.append(0)
+            return (source,), 0
+
+        graph = self.graph
+        offsets = graph.offsets
+        targets = graph.targets
+        costs = self.costs
+        num_nodes = graph.num_nodes
+        visit_minimum = self.visit_counts.minimum
+        edge_visits = self.visit_counts.counts
+        potential = self.potential
+        push, pop = heap_functions(self.stats)  # Plain heapq functions unless instrumented
+        rejected = 0  # Edges skipped by the visit-count filter
+
+        # Index 0 is the forward search from start, index 1 the backward search from end.
+        # Tentative distances and predecessors live in flat arrays; heap entries are (key, node)
+        # where the key is the distance plus the side's potential (+p forward, -p backward).
+        def key(side, dist, node):
+            if potential is None:
+                return dist
+            return dist + potential(node) if side == 0 else dist - potential(node)
+
+        heaps = ([(key(0, 0, source), source)], [(key(1, 0, target), target)])
+        dists = (array('d', [INF]) * num_nodes, array('d', [INF]) * num_nodes)
+        parents = (array('i', [-1]) * num_nodes, array('i', [-1]) * num_nodes)
+        settled = (bytearray(num_nodes), bytearray(num_nodes))
+        dists[0][source] = 0
+        dists[1][target] = 0
+        best_cost = INF  # Cheapest start-end connection seen so far
+        meeting = None  # (forward node, backward node, edge slot) of that connection
+        settled_nodes = 0
+
+        while heaps[0] and heaps[1]:
+            # Discard entries of nodes that were settled or relabelled after being pushed
+            for side in (0, 1):
+                heap = heaps[side]
+                while heap and (settled[side][heap[0][1]] or heap[0][0] > key(side, dists[side][heap[0][1]], heap[0][1])):
+                    pop(heap)
+            if not heaps[0] or not heaps[1]:
+                break
+
+            # Stop once no connection through the two frontiers can beat the best one found
+            # (the potentials cancel out: +p and -p reduce every edge by the same amount)
+            if heaps[0][0][0] + heaps[1][0][0] >= best_cost:
+                break
+
+            # Expand the side with the smaller frontier, which is the cheaper one to grow
+            side = 0 if len(heaps[0]) <= len(heaps[1]) else 1
+            other = 1 - side
+            node = pop(heaps[side])[1]
+            dist = dists[side][node]
+            settled[side][node] = 1
+            settled_nodes += 1
+
+            side_dist, side_parent = dists[side], parents[side]
+            other_dist = dists[other]
+            least_visits = visit_minimum[node]
+            for edge in range(offsets[node], offsets[node + 1]):
+                if edge_visits[edge] > least_visits:
+                    rejected += 1
+                    continue  # Only follow the node's least visited edges (see VisitCounts.allowed)
+                neighbor = targets[edge]
+                new_dist = dist + costs[edge]  # Precomputed cost of the edge under the cost model
+                if new_dist < side_dist[neighbor]:
+                    side_dist[neighbor] = new_dist
+                    side_parent[neighbor] = node
+                    push(heaps[side], (key(side, new_dist, neighbor), neighbor))
+                if new_dist + other_dist[neighbor] < best_cost:
+                    best_cost = new_dist + other_dist[neighbor]
+                    meeting = (node, neighbor, edge) if side == 0 else (neighbor, node, edge)
+
+        self.settled_per_search.append(settled_nodes)
+        count(self.stats, 'visit_rejections', rejected)
+        if meeting is None:
+            return None, None
+
+        # Rebuild the path once, across the meeting edge. The backward label of the far end may
+        # have improved since the connection was recorded, so cost the path by its final labels.
+        forward_node, backward_node, edge = meeting
+        full_path = tuple(trace(parents[0], forward_node)[::-1] + trace(parents[1], backward_node))
+        return full_path, dists[0][forward_node] + costs[edge] + dists[1][backward_node]
+
+def trace(parents, node):
+    # Follow the predecessor pointers from node back to the search root
+    chain = []
+    while node != -1:
+        chain.append(node)
+        node = parents[node]
+    return chain
+
+class PathSearch:
+    """The paths of one start -> end query, found on demand and kept for reuse.
 
-    def filter_paths(paths):
-        unique_paths = set()
-        for path in paths:
-            path_tuple = tuple(path)
-            unique_paths.add(path_tuple)
-        return unique_paths
+    extend(k) only runs the searches needed to go from the searches done so far to k, so
+    raising k continues where the previous call stopped: the modified BDA session keeps
+    its visit counts, and Yen keeps its accepted paths and candidates.
+    """
 
-    for _ in range(k):
-        path, cost = bidirectional_dijkstra()
-        if path is None:
-            break
+    def __init__(self, graph, start, end, pos=None, stats=None, mode='dijkstra', landmarks=None, hierarchy=None,
+                 cost_model=None, engine='mbda'):
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown engine: {engine}")
+        self.graph = graph
+        self.stats = stats
+        self.searches = 0  # Searches run so far (the modified BDA may repeat a path, so this can exceed len(paths))
+        self.paths = []  # PathResults in discovery order
+        self.results = []  # (path of node ids, cost) of every search, repeats included
+        self._found = set()
+        if start not in graph.node_ids or end not in graph.node_ids:
+            self._results = iter(())
+        elif engine == 'yen':
+            self._results = iter_yen_k_shortest_paths(graph, start, end, INF, stats=stats, cost_model=cost_model)
+        else:
+            self.session = QuerySession(graph, graph.node_ids[start], graph.node_ids[end], pos=pos, mode=mode,
+                                        landmarks=landmarks, hierarchy=hierarchy, cost_model=cost_model, stats=stats)
+            self._results = self._session_results()
 
-        update_visit_counts(path)
-        paths_with_costs.append((list(path), cost))
+    def _session_results(self):
+        while True:
+            path, cost = self.session.next_path()
+            if self.stats is not None:
+                self.stats['settled_per_search'] = self.session.settled_per_search
+                self.stats['settled_nodes'] = sum(self.session.settled_per_search)
+            if path is None:
+                return
+            yield path, cost
 
-    # Filter paths before adding to found_paths
-    filtered_paths = filter_paths([p[0] for p in paths_with_costs])
+    def extend(self, k):
+        """Yield a PathResult for each new path found while raising the number of searches to k."""
+        while self.searches < k:
+            found = next(self._results, None)
+            if found is None:
+                self.searches = k  # No more paths; later calls need not search again
+                return
+            self.searches += 1
+            self.results.append(found)
+            path, cost = found
+            if path in self._found:
+                continue  # Same route as an earlier search; the visit counts still moved on
+            self._found.add(path)
+            result = PathResult(self.graph, path, cost)
+            self.paths.append(result)
+            yield result
 
-    # Add the filtered paths to found_paths
-    found_paths.update(filtered_paths)
+def iter_k_shortest_paths(graph, start, end, k, pos, stats=None, mode='dijkstra', landmarks=None, hierarchy=None,
+                          cost_model=None, engine='mbda'):
+    """Yield a PathResult for each new start -> end path as soon as it is found.
 
-    sorted_paths = sorted(filtered_paths, key=lambda p: next(cost for path, cost in paths_with_costs if list(path) == list(p)))
+    Takes the same arguments as k_shortest_paths. Paths come in discovery order (the
+    modified BDA skips a search that repeats an earlier path, so fewer than k may come).
+    stats is kept current after every path, and the consumer can stop at any point
+    without paying for the rest. Use PathSearch directly to raise k later.
+    """
+    yield from PathSearch(graph, start, end, pos=pos, stats=stats, mode=mode, landmarks=landmarks, hierarchy=hierarchy,
+                          cost_model=cost_model, engine=engine).extend(k)
 
-    return sorted_paths, paths_with_costs  # Return both sorted paths and their costs
+def k_shortest_paths(graph, start, end, k, pos, stats=None, mode='dijkstra', landmarks=None, hierarchy=None, cost_model=None,
+                     engine='mbda'):
+    search = PathSearch(graph, start, end, pos=pos, stats=stats, mode=mode, landmarks=landmarks, hierarchy=hierarchy,
+                        cost_model=cost_model, engine=engine)
+    for _ in search.extend(k):
+        pass
+    sorted_paths = sorted(search.paths, key=attrgetter('cost'))
+    paths_with_costs = [(graph.path_names(path), cost) for path, cost in search.results]
+    return sorted_paths, paths_with_costs  # Return both sorted path results and their costs
@@ -1,6 +1,17 @@
+import io
+import os
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
 import networkx as nx
+import numpy as np
 import matplotlib.pyplot as plt
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from matplotlib.image import imread
+from matplotlib.lines import Line2D
 from PIL import Image  # Import the Pillow library
+from Instrumentation import record_time
 
 
 def wrap_labels(text, max_words_per_line=1):
@@ -17,82 +28,159 @@ def wrap_labels(text, max_words_per_line=1):
     
     return '\n'.join(lines)
 
-def draw_graph_with_path(graph, path, path_number, pos, start, end, total_cost, background_image=None, node_info=None):
-    G = nx.Graph()
-    
-    # Normalize node names
-    start = start.strip()
-    end = end.strip()
-    
-    # Add edges to the graph
-    for node1, neighbors in graph.edges.items():
-        for node2, weight in neighbors.items():
-            G.add_edge(node1.strip(), node2.strip(), weight=weight)  # Normalize node names
-    
-    # Create wrapped labels
-    labels = {node: wrap_labels(node) for node in G.nodes()}
-    
-    # Set figure size based on the background image dimensions
-    if background_image:
-        img = Image.open(background_image)
-        width, height = img.size
-        fig, ax = plt.subplots(figsize=(width / 100, height / 100))  # Convert pixels to inches
-    else:
-        fig, ax = plt.subplots(figsize=(8, 6))  # Default size if no background image
+class PathRenderer:
+    """Draws paths over a base layer that is rendered once per graph and background.
 
-    # Draw the graph
-    nx.draw(G, pos, with_labels=True, labels=labels, node_size=250, font_size=7, ax=ax)
-    
-    # Set background image if provided
-    if background_image:
-        img = plt.imread(background_image)
-        ax.imshow(img, extent=[0, 10, 0, 7], aspect='auto', zorder=0)  # Adjust extent based on your coordinate range
-    
-    # Set node colors
-    node_colors = []
-    for node in G.nodes():
-        if node == start:
-            node_colors.append('green')  # Start node color
-        elif node == end:
-            node_colors.append('red')  # End node color
-        else:
-            node_colors.append('lightblue')  # Default color for other nodes
-    
-    # Redraw the graph with the correct node colors and gray edges
-    nx.draw(G, pos, with_labels=True, labels=labels, node_color=node_colors, node_size=250, font_size=7, ax=ax, edge_color='gray')
-    
-    # Highlight the path color
-    path_edges = [(path[i], path[i + 1]) for i in range(len(path) - 1)]
-    nx.draw_networkx_edges(G, pos, edgelist=path_edges, edge_color='blue', width=2.5, ax=ax)
+    The background image, the whole network with its labels and edge weights, and the
+    legend are rasterized once; each path figure shows that raster and only draws the
+    path's own edges, nodes and labels on top of it. Figures, images and legend handles
+    are made without pyplot's figure manager, so a renderer can also be used from worker
+    threads or processes (see RenderPool).
+    """
 
-    # Annotate edges with weights
-    edge_labels = {(node1, node2): weight for node1, neighbors in graph.edges.items() for node2, weight in neighbors.items()}
-    nx.draw_networkx_edge_labels(G, pos, edge_labels=edge_labels, font_color='black', font_size=5, ax=ax)
-    
-    # Add legend
-    legend_elements = [
-        plt.Line2D([0], [0], marker='o', color='w', label='Starting Location',
+    def __init__(self, graph, pos, background_image=None, figsize=None, dpi=100):
+        self.pos = pos
+        self.G = nx.Graph()
+
+        # Add edges to the graph
+        for node1, neighbors in graph.edges.items():
+            for node2, weight in neighbors.items():
+                self.G.add_edge(node1.strip(), node2.strip(), weight=weight)  # Normalize node names
+
+        # Create wrapped labels
+        self.labels = {node: wrap_labels(node) for node in self.G.nodes()}
+        self.edge_labels = {(node1, node2): weight for node1, neighbors in graph.edges.items() for node2, weight in neighbors.items()}
+
+        # Set figure size based on the background image dimensions
+        if figsize is None and background_image:
+            width, height = Image.open(background_image).size
+            figsize = (width / 100, height / 100)  # Convert pixels to inches
+        self.figsize = figsize or (8, 6)  # Default size if no background image
+
+        fig = Figure(figsize=self.figsize, dpi=dpi)
+        FigureCanvasAgg(fig)
+        ax = fig.add_subplot()
+
+        # Draw the network in its base colors (gray edges, light blue landmarks)
+        nx.draw(self.G, pos, with_labels=True, labels=self.labels, node_color='lightblue', node_size=250, font_size=7, ax=ax,
+                edge_color='gray')
+
+        # Set background image if provided
+        if background_image:
+            img = imread(background_image)
+            ax.imshow(img, extent=[0, 10, 0, 7], aspect='auto', zorder=0)  # Adjust extent based on your coordinate range
+
+        # Annotate edges with weights
+        nx.draw_networkx_edge_labels(self.G, pos, edge_labels=self.edge_labels, font_color='black', font_size=5, ax=ax)
+
+        # Add legend
+        legend_elements = [
+            Line2D([0], [0], marker='o', color='w', label='Starting Location',
                    markerfacecolor='green', markersize=10),
-        plt.Line2D([0], [0], marker='o', color='w', label='Destination',
+            Line2D([0], [0], marker='o', color='w', label='Destination',
                    markerfacecolor='red', markersize=10),
-        plt.Line2D([0], [0], marker='o', color='w', label='Landmarks',
+            Line2D([0], [0], marker='o', color='w', label='Landmarks',
                    markerfacecolor='lightblue', markersize=10),
-        plt.Line2D([0], [0], color='gray', label='Pedestrian Network', linewidth=2),
-        plt.Line2D([0], [0], color='blue', label='Path', linewidth=2)
-    ]
+            Line2D([0], [0], color='gray', label='Pedestrian Network', linewidth=2),
+            Line2D([0], [0], color='blue', label='Path', linewidth=2)
+        ]
 
-    # Place legend at the bottom of the figure
-    ax.legend(handles=legend_elements, loc='lower center', bbox_to_anchor=(0.5, -0.1),
-              ncol=5, frameon=False)
-    
-    # Remove axes but keep the legend
-    ax.set_xticks([])
-    ax.set_yticks([])
-    
-    # Adjust layout to minimize whitespace
-    plt.tight_layout()  # Automatically adjust subplot parameters to give specified padding
-    
-    return fig  # Return the figure instead of showing it
+        # Place legend at the bottom of the figure
+        ax.legend(handles=legend_elements, loc='lower center', bbox_to_anchor=(0.5, -0.1),
+                  ncol=5, frameon=False)
+
+        # Adjust layout to minimize whitespace, then keep the pixels and where the axes ended up
+        fig.tight_layout()
+        fig.canvas.draw()
+        self.base = np.asarray(fig.canvas.buffer_rgba()).copy()
+        self.axes_position = ax.get_position().bounds
+        self.xlim = ax.get_xlim()
+        self.ylim = ax.get_ylim()
+
+    def draw(self, path, start, end):
+        """Return a figure of the base layer with one path highlighted."""
+        start = start.strip()
+        end = end.strip()
+        fig = Figure(figsize=self.figsize)
+        FigureCanvasAgg(fig)
+
+        # The base layer fills the figure; the overlay axes sit exactly where the base axes were
+        base_ax = fig.add_axes([0, 0, 1, 1])
+        base_ax.imshow(self.base, extent=[0, 1, 0, 1], aspect='auto')
+        base_ax.set_axis_off()
+        ax = fig.add_axes(self.axes_position)
+        ax.set_xlim(self.xlim)
+        ax.set_ylim(self.ylim)
+        ax.set_axis_off()
+
+        # Highlight the path, then redraw its nodes and labels above it as in the full drawing
+        path_edges = [(path[i], path[i + 1]) for i in range(len(path) - 1)]
+        nx.draw_networkx_edges(self.G, self.pos, edgelist=path_edges, edge_color='blue', width=2.5, ax=ax)
+        nodes = [node.strip() for node in dict.fromkeys(path)]
+        node_colors = ['green' if node == start else 'red' if node == end else 'lightblue' for node in nodes]
+        nx.draw_networkx_nodes(self.G, self.pos, nodelist=nodes, node_color=node_colors, node_size=250, ax=ax)
+        nx.draw_networkx_labels(self.G, self.pos, labels={node: self.labels[node] for node in nodes}, font_size=7, ax=ax)
+        path_edge_labels = {edge: weight for edge, weight in self.edge_labels.items()
+                            if edge in path_edges or edge[::-1] in path_edges}
+        nx.draw_networkx_edge_labels(self.G, self.pos, edge_labels=path_edge_labels, font_color='black', font_size=5, ax=ax)
+        return fig
+
+def get_path_renderer(graph, pos, background_image=None, figsize=None):
+    """Return the graph's renderer for a background and figure size, rendering the base layer on first use."""
+    if pos is not graph.pos:
+        return PathRenderer(graph, pos, background_image, figsize)
+    key = ('path_renderer', background_image, figsize)
+    if key not in graph.derived:
+        graph.derived[key] = PathRenderer(graph, pos, background_image, figsize)
+    return graph.derived[key]
+
+def render_path_png(renderer, path, start, end, stats=None):
+    """Render one path figure with the Agg backend and return it as PNG bytes.
+
+    With a stats dict, the figure's render time is added to 'render_ms' and kept in 'render_ms_each'.
+    """
+    started = time.perf_counter()
+    buffer = io.BytesIO()
+    renderer.draw(path, start, end).savefig(buffer, format='png')
+    record_time(stats, 'render', (time.perf_counter() - started) * 1000, each=True)
+    return buffer.getvalue()
+
+# Renderer of the current pool, set once in every render worker process
+_render_worker = {}
+
+def _init_render_worker(renderer):
+    _render_worker['renderer'] = renderer
+
+def _render_in_worker(task):
+    path, start, end = task
+    stats = {}
+    image = render_path_png(_render_worker['renderer'], path, start, end, stats)
+    return image, stats['render_ms']
+
+class RenderPool:
+    """Worker processes that render the path figures of one renderer to PNG bytes in parallel.
+
+    The renderer (with its base layer) is sent to each worker once; a task only carries
+    the path. Workers are spawned fresh rather than forked, so they share no state with
+    a GUI process. Spawning re-imports the main script, so a worker of GUI.py imports
+    PySide6, but it never creates a Qt application or widget.
+    """
+
+    def __init__(self, renderer, processes=None):
+        self.renderer = renderer
+        self.executor = ProcessPoolExecutor(max_workers=processes or os.cpu_count(), mp_context=multiprocessing.get_context('spawn'),
+                                            initializer=_init_render_worker, initargs=(renderer,))
+
+    def submit(self, path, start, end):
+        """Queue a path; returns a Future of (PNG bytes, render time in ms)."""
+        return self.executor.submit(_render_in_worker, (list(path), start, end))
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+def draw_graph_with_path(graph, path, path_number, pos, start, end, total_cost, background_image=None, node_info=None, figsize=None):
+    # The network and background come from the cached base layer; only the path is drawn here
+    return get_path_renderer(graph, pos, background_image, figsize).draw(path, start, end)
 
 def draw_full_graph(graph, pos, background_image=None):
     G = nx.Graph()
@@ -146,7 +234,7 @@ def draw_full_graph(graph, pos, background_image=None):
 
 def display_paths(sorted_paths, k, paths_with_costs, graph, pos, start, end):
     for i, path in enumerate(sorted_paths, start=1):
-        cost = next(cost for p, cost in paths_with_costs if list(p) == list(path))
+        cost = path.cost  # PathResult from k_shortest_paths
         print(f"Path {i}: {' -> '.join(path)}, Cost: {cost}")
         draw_graph_with_path(graph, path, i, pos, start, end, cost)
 
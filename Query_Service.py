@@ -0,0 +1,217 @@
+"""Long-running HTTP/JSON service answering k shortest paths and diversity metrics queries.
+
+    python Query_Service.py --port 8080
+    curl 'http://127.0.0.1:8080/paths?graph=moa&start=Three%20E-com%20Center&end=MAAX&k=3'
+
+Every graph in Graphs/ is compiled once (read_graph_from_files runs only when its files
+change) and memory-mapped by the service and by each worker process, so a query pays
+neither Qt startup nor file parsing. The asyncio front end only parses requests; the
+searches and metrics run in a process pool. Identical queries arriving while one is
+being answered wait for its result instead of searching again, and finished results
+are kept in a ResultCache.
+
+Endpoints: GET /paths?graph=&start=&end=&k=&mode=&cost_model=&engine= (or POST /paths
+with the same fields as a JSON object), GET /graphs and GET /stats.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import parse_qsl, urlsplit
+from Batch_Query import init_worker, run_worker_query
+from Contraction_Hierarchy import hierarchy_path, load_contraction_hierarchy
+from Graph import cost_model
+from Graph_Cache import compiled_path, graph_file_pairs, load_compiled_graph
+from Headless_Query import GRAPHS_DIRECTORY, result_record
+from Modified_BDA import ENGINES, SEARCH_MODES
+from Result_Cache import ResultCache
+
+MAX_K = 20  # Largest k a request may ask for
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 500: "Internal Server Error"}
+
+def _run_query(name, start, end, k, mode, route_cost, engine):
+    # The record is built here: PathResults pickle cheaply, but the metrics hold the mapped graph
+    _, paths, metrics = run_worker_query(name, start, end, k, mode, route_cost, engine)
+    return result_record(start, end, k, paths, metrics)
+
+class QueryError(Exception):
+    """A request the service cannot answer; status is the HTTP status to reply with."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+class QueryService:
+    """Preloaded graphs, the search process pool and the bookkeeping of answered and running queries."""
+
+    def __init__(self, graphs_directory=GRAPHS_DIRECTORY, processes=None, cache_size=256):
+        self.graphs = {}  # Graph name (e.g. moa-graph1) -> Graph
+        graph_files = {}  # Graph name -> (compiled file, hierarchy file or None), mapped by the workers
+        for nodes_filename, edges_filename in graph_file_pairs(graphs_directory):
+            name = os.path.splitext(os.path.basename(edges_filename))[0]
+            graph = load_compiled_graph(nodes_filename, edges_filename)  # Compiles the graph if the sources changed
+            hierarchy = load_contraction_hierarchy(graph, edges_filename, build=False)
+            self.graphs[name] = graph
+            graph_files[name] = (compiled_path(edges_filename), hierarchy_path(edges_filename) if hierarchy else None)
+        # Spawned, not forked: a worker forked at the first query would inherit the open client sockets
+        # and keep them from closing when the service is done with them
+        self.executor = ProcessPoolExecutor(max_workers=processes or os.cpu_count(), initializer=init_worker,
+                                            initargs=(graph_files,), mp_context=multiprocessing.get_context('spawn'))
+        self.results = ResultCache(cache_size)
+        self.in_flight = {}  # Cache key -> future of the query being answered
+        self.coalesced = 0  # Requests that waited for an identical running query
+
+    def graph_name(self, name):
+        # Full names or short ones: 'moa' is the first moa-graph<N>
+        if name in self.graphs:
+            return name
+        for full_name in self.graphs:
+            if full_name.startswith(f"{name}-graph"):
+                return full_name
+        raise QueryError(404, f"Unknown graph: {name}")
+
+    async def query(self, params):
+        """Answer one /paths request: from the cache, from an identical running query, or by a new search."""
+        for field in ('graph', 'start', 'end', 'mode', 'engine', 'cost_model'):
+            if params.get(field) is not None and not isinstance(params[field], str):
+                raise QueryError(400, f"{field} must be a string")  # A JSON body can send any value
+        for field in ('graph', 'start', 'end'):
+            if not params.get(field):
+                raise QueryError(400, f"Missing parameter: {field}")
+        name = self.graph_name(params['graph'])
+        graph = self.graphs[name]
+        start, end = params['start'], params['end']
+        for node in (start, end):
+            if node not in graph.node_ids:
+                raise QueryError(400, f"Unknown node: {node}")
+        k = str(params.get('k', 3))
+        if not k.isdigit() or not 1 <= int(k) <= MAX_K:
+            raise QueryError(400, f"k must be a number from 1 to {MAX_K}")
+        k = int(k)
+        mode = params.get('mode', 'dijkstra')
+        engine = params.get('engine', 'mbda')
+        if mode not in SEARCH_MODES or engine not in ENGINES:
+            raise QueryError(400, f"mode must be one of {SEARCH_MODES} and engine one of {ENGINES}")
+        try:
+            route_cost = cost_model(params['cost_model']) if params.get('cost_model') else graph.cost_model
+        except ValueError as error:
+            raise QueryError(400, str(error))
+
+        key = ResultCache.key(graph, start, end, k, route_cost, mode, engine)  # Compiled graphs always have a fingerprint
+        result = self.results.get(key)
+        if result is not None:
+            return result
+        future = self.in_flight.get(key)
+        if future is None:
+            future = asyncio.get_running_loop().run_in_executor(self.executor, _run_query, name, start, end, k, mode,
+                                                                route_cost, engine)
+            self.in_flight[key] = future
+            future.add_done_callback(lambda done: self._finish(key, done))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(future)  # A client that goes away must not cancel the others' search
+
+    def _finish(self, key, future):
+        del self.in_flight[key]
+        if not future.cancelled() and future.exception() is None:
+            self.results.put(key, future.result())
+
+    def stats(self):
+        return dict(self.results.stats(), in_flight=len(self.in_flight), coalesced=self.coalesced)
+
+    async def respond(self, method, target, body):
+        """(HTTP status, JSON-ready payload) for one request."""
+        url = urlsplit(target)
+        try:
+            if url.path == '/paths':
+                if method == 'GET':
+                    params = dict(parse_qsl(url.query))
+                elif method == 'POST':
+                    try:
+                        params = json.loads(body or b'{}')
+                    except ValueError:
+                        raise QueryError(400, "The request body is not valid JSON")
+                    if not isinstance(params, dict):
+                        raise QueryError(400, "The request body must be a JSON object")
+                else:
+                    raise QueryError(405, f"{method} is not supported here")
+                return 200, await self.query(params)
+            if url.path in ('/graphs', '/stats') and method != 'GET':
+                raise QueryError(405, f"{method} is not supported here")
+            if url.path == '/graphs':
+                return 200, {name: {'nodes': graph.num_nodes, 'edges': graph.num_edges // 2}
+                             for name, graph in self.graphs.items()}
+            if url.path == '/stats':
+                return 200, self.stats()
+            raise QueryError(404, f"Unknown endpoint: {url.path}")
+        except QueryError as error:
+            return error.status, {'error': str(error)}
+        except Exception as error:
+            return 500, {'error': f"{type(error).__name__}: {error}"}
+
+    async def handle(self, reader, writer):
+        # One client connection; HTTP/1.1 requests on it are answered in turn until it closes
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    field, _, value = line.decode('latin-1').partition(':')
+                    headers[field.strip().lower()] = value.strip()
+                parts = request_line.decode('latin-1').split()
+                length = headers.get('content-length', '0')
+                if len(parts) != 3 or not length.isdigit():
+                    status, payload, version = 400, {'error': "Malformed request"}, 'HTTP/1.0'
+                else:
+                    method, target, version = parts
+                    status, payload = await self.respond(method, target, await reader.readexactly(int(length)))
+
+                keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                data = json.dumps(payload).encode()
+                writer.write(f"HTTP/1.1 {status} {REASONS[status]}\r\nContent-Type: application/json\r\n"
+                             f"Content-Length: {len(data)}\r\nConnection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+                             .encode('latin-1') + data)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass  # The client went away
+        finally:
+            writer.close()
+
+    def close(self):
+        self.executor.shutdown(cancel_futures=True)
+
+async def serve(service, host='127.0.0.1', port=8080):
+    server = await asyncio.start_server(service.handle, host, port)
+    print(f"Serving {', '.join(service.graphs)} on http://{host}:{port}")
+    async with server:
+        await server.serve_forever()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve k shortest paths and diversity metrics over HTTP/JSON.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--graphs', default=GRAPHS_DIRECTORY, help="directory of <name>-coordinates<N>.txt / <name>-graph<N>.txt pairs")
+    parser.add_argument('--processes', type=int, default=None, help="search processes (default: one per CPU)")
+    parser.add_argument('--cache-size', type=int, default=256, help="finished queries kept for repeated requests")
+    args = parser.parse_args(argv)
+
+    service = QueryService(args.graphs, processes=args.processes, cache_size=args.cache_size)
+    try:
+        asyncio.run(serve(service, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
+
+
+if __name__ == "__main__":
+    main()
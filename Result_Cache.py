@@ -0,0 +1,70 @@
+from collections import OrderedDict
+
+class ResultCache:
+    """Bounded least-recently-used cache of finished queries.
+
+    Keys start with the graph fingerprint (the hash of its source files), so results
+    computed before the files changed can never be served for the new graph; invalidate()
+    drops them right away instead of waiting for them to age out.
+    """
+
+    def __init__(self, maxsize=32):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # Key -> stored value, least recently used first
+
+    @staticmethod
+    def key(graph, start, end, k, cost_model, mode='dijkstra', engine='mbda'):
+        """Cache key of a query; None for a graph without a fingerprint (not loaded from a compiled file)."""
+        if graph.fingerprint is None:
+            return None
+        return (graph.fingerprint, start, end, k, tuple(cost_model or graph.cost_model), mode, engine)
+
+    def get(self, key):
+        """Return the stored value and mark it as recently used, or None on a miss."""
+        if key is None or key not in self._entries:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return self._entries[key]
+
+    def put(self, key, value):
+        """Store a value, evicting the least recently used entries beyond maxsize."""
+        if key is None:
+            return value
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+        return value
+
+    def take_smaller(self, key):
+        """Remove and return the entry of the same query with the largest smaller k, or None.
+
+        Such an entry can be extended to the larger k instead of starting over; it leaves
+        the cache because extending changes it in place.
+        """
+        if key is None:
+            return None
+        query = key[:3] + key[4:]  # Everything but k
+        best = None
+        for other in self._entries:
+            if other[:3] + other[4:] == query and other[3] < key[3] and (best is None or other[3] > best[3]):
+                best = other
+        return self._entries.pop(best) if best is not None else None
+
+    def invalidate(self, fingerprint=None):
+        """Drop the entries of one graph fingerprint, or every entry."""
+        if fingerprint is None:
+            self._entries.clear()
+            return
+        for key in [key for key in self._entries if key[0] == fingerprint]:
+            del self._entries[key]
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._entries), 'maxsize': self.maxsize}
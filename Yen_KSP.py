@@ -0,0 +1,128 @@
+import time
+from Heuristics import shortest_path_tree
+from Instrumentation import heap_functions, record_time
+
+INF = float('inf')
+
+def iter_yen_k_shortest_paths(graph, start, end, k, stats=None, cost_model=None):
+    """Yield the k shortest loopless start -> end paths (Yen) as (path of node ids, cost), cheapest first.
+
+    One shortest-path tree towards end is built up front (edges are undirected, so it also
+    gives every node's exact cost to end). It is reused by every spur search: when the tree
+    path from the spur node avoids everything the spur search must avoid, it is taken as is;
+    otherwise it serves as an exact lower bound for an A* spur search. Candidates wait in a
+    lazy heap and are only turned into accepted paths when popped. stats is kept current
+    after every path, so a consumer that stops early still sees the work done so far.
+    """
+    if start not in graph.node_ids or end not in graph.node_ids:
+        return
+    source = graph.node_ids[start]
+    target = graph.node_ids[end]
+    costs = graph.edge_costs(cost_model)
+    offsets = graph.offsets
+    targets = graph.targets
+    push, pop = heap_functions(stats)  # Plain heapq functions unless instrumented
+    started = time.perf_counter() if stats is not None else 0
+    tree_dist, tree_next = shortest_path_tree(graph, target, cost_model, stats)
+    settled_nodes = sum(1 for d in tree_dist if d < INF)  # The tree search settles every reachable node
+    spur_searches = 0
+    tree_reuses = 0
+
+    def path_cost(path):
+        return sum(costs[graph.edge_index(path[i], path[i + 1])] for i in range(len(path) - 1))
+
+    def tree_path(node):
+        path = [node]
+        while node != target:
+            node = tree_next[node]
+            path.append(node)
+        return path
+
+    def spur_search(spur, blocked_nodes, blocked_edges):
+        # A* from spur to end avoiding the root path nodes and the removed spur edges
+        nonlocal settled_nodes
+        dist = {spur: 0}
+        parent = {spur: -1}
+        heap = [(tree_dist[spur], spur)]
+        done = set()
+        while heap:
+            _, u = pop(heap)
+            if u in done:
+                continue
+            done.add(u)
+            settled_nodes += 1
+            if u == target:
+                path = []
+                while u != -1:
+                    path.append(u)
+                    u = parent[u]
+                return path[::-1], dist[target]
+            for edge in range(offsets[u], offsets[u + 1]):
+                v = targets[edge]
+                if v in blocked_nodes or edge in blocked_edges or tree_dist[v] == INF:
+                    continue
+                new_dist = dist[u] + costs[edge]
+                if new_dist < dist.get(v, INF):
+                    dist[v] = new_dist
+                    parent[v] = u
+                    push(heap, (new_dist + tree_dist[v], v))
+        return None, None
+
+    def report():
+        if stats is not None:
+            stats['settled_nodes'] = settled_nodes
+            stats['spur_searches'] = spur_searches
+            stats['tree_reuses'] = tree_reuses
+
+    def lap():
+        # Time of the search for one path (the first includes the shortest-path tree)
+        nonlocal started
+        if stats is not None:
+            record_time(stats, 'search', (time.perf_counter() - started) * 1000)
+            started = time.perf_counter()
+
+    accepted = []
+    if k > 0 and tree_dist[source] < INF:
+        path = tuple(tree_path(source))
+        accepted.append((path, path_cost(path)))
+        report()
+        lap()
+        yield accepted[-1]
+    candidates = []  # Heap of (cost, path)
+    seen = {path for path, _ in accepted}
+
+    while accepted and len(accepted) < k:
+        previous = accepted[-1][0]
+        root_cost = 0
+        for j in range(len(previous) - 1):
+            spur = previous[j]
+            root = previous[:j + 1]
+            blocked_nodes = set(root[:-1])
+            blocked_edges = {graph.edge_index(spur, path[j + 1]) for path, _ in accepted
+                             if len(path) > j + 1 and path[:j + 1] == root}
+
+            # Reuse the shortest-path tree when its path from the spur node is still allowed
+            spur_path = tree_path(spur)
+            if graph.edge_index(spur, spur_path[1]) not in blocked_edges and blocked_nodes.isdisjoint(spur_path):
+                spur_cost = tree_dist[spur]
+                tree_reuses += 1
+            else:
+                spur_path, spur_cost = spur_search(spur, blocked_nodes, blocked_edges)
+                spur_searches += 1
+
+            if spur_path is not None:
+                candidate = root[:-1] + tuple(spur_path)
+                if candidate not in seen:
+                    seen.add(candidate)
+                    push(candidates, (root_cost + spur_cost, candidate))
+            root_cost += costs[graph.edge_index(spur, previous[j + 1])]
+
+        if not candidates:
+            lap()
+            break
+        _, path = pop(candidates)
+        accepted.append((path, path_cost(path)))
+        report()
+        lap()
+        yield accepted[-1]
+    report()